@@ -0,0 +1,56 @@
+from dataclasses import dataclass
+from typing import Optional
+
+from memory import available_memory
+
+
+# how a circuit of a given width is simulated, picked before anything is submitted to Aer
+# statevector keeps 2^n amplitudes (16 bytes each, 8 in single precision); exact sampling (shots = None) also returns
+# every non-zero probability, which costs more than the amplitudes themselves
+# matrix_product_state keeps n tensors of bond^2 pairs of amplitudes: with a linear ry/cz ansatz of `reps` layers
+# the bond dimension never exceeds 2^reps, so it is exact and grows linearly with the width
+@dataclass(frozen=True)
+class SimulatorPlan:
+    method: str = "statevector"
+    precision: str = "double"
+    shots: Optional[int] = None # None for exact probabilities
+    bond: Optional[int] = None # matrix_product_state only
+
+    def amplitude_bytes(self) -> int:
+        return 16 if self.precision == "double" else 8
+
+    def memory(self, qubits: int) -> float:
+        if self.method == "matrix_product_state":
+            state = qubits * 2 * self.bond ** 2 * self.amplitude_bytes() * 4 # svd workspace
+        else:
+            state = 2.0 ** qubits * self.amplitude_bytes()
+        return state + (2.0 ** qubits * distribution_bytes if self.shots is None else 0)
+
+    # ansatz entanglement the method can simulate efficiently
+    def entanglement(self) -> str:
+        return "linear" if self.method == "matrix_product_state" else "full"
+
+    # empty for the default plan, so samplers are built exactly as before
+    def backend_options(self) -> dict:
+        if self == SimulatorPlan():
+            return {}
+        options = {"method": self.method, "precision": self.precision}
+        if self.bond is not None:
+            options["matrix_product_state_max_bond_dimension"] = self.bond
+        return options
+
+    def run_options(self, seed: int) -> dict:
+        return {} if self.shots is None else {"shots": self.shots, "seed": seed}
+
+distribution_bytes = 100 # a python dict entry of a quasi-distribution
+
+# first plan of statevector (exact, then sampled, then single precision) and matrix_product_state that fits the budget
+def choose(qubits: int, memory_budget: Optional[float] = None, shots: int = 1024, reps: int = 3) -> SimulatorPlan:
+    budget = memory_budget if memory_budget is not None else available_memory()
+    plans = [SimulatorPlan(), SimulatorPlan(shots=shots), SimulatorPlan(precision="single", shots=shots),
+             SimulatorPlan("matrix_product_state", shots=shots, bond=2 ** reps)]
+    for plan in plans:
+        if plan.memory(qubits) <= budget:
+            return plan
+    raise MemoryError(f"{qubits} qubits do not fit {budget:.0f} bytes with any simulation method "
+                      f"(matrix_product_state needs {plans[-1].memory(qubits):.0f}), use smaller chunks (qbits)")
@@ -0,0 +1,213 @@
+import time
+from typing import Optional
+
+from hamicomp import *
+
+
+# variables without couplings between them: flipping one does not change the flip energy of another
+# columns are the variables coupled to any member, for each of them positions (into members, len(members) pads) and
+# values of those couplings, so the fields of a class are updated with one gather
+@dataclass
+class Colour:
+    members: np.ndarray
+    columns: np.ndarray
+    positions: np.ndarray
+    values: np.ndarray
+
+
+# state of all chains: bits, local fields (couplings @ x) and constraint left-hand sides, one row per chain
+@dataclass
+class Chains:
+    x: np.ndarray
+    field: np.ndarray
+    sums: np.ndarray
+    linear: np.ndarray
+    colours: list[Colour]
+    rows: np.ndarray
+    lower: np.ndarray
+    upper: np.ndarray
+    unit: float
+    penalty: float
+
+
+# simulated annealing over the QuadraticProgram of formulate_problem, for QUBOs far beyond eigensolver/statevector sizes
+# `chains` independent Metropolis chains run side by side as rows of numpy arrays, the energy change of flipping a variable
+# is read from a local field kept per chain (linear + couplings to the other variables)
+# a sweep visits the colour classes of the coupling graph in order and updates all variables of a class at once, so a
+# sparse (banded, block) problem of thousands of variables takes a handful of numpy operations per sweep; a dense one
+# (a full covariance matrix) has a class per variable and is visited one variable at a time
+# linear constraints (a budget) are penalized by a fixed amount for being outside of them at all plus how far outside, per
+# smallest coefficient; the left-hand sides are kept per chain as well, so there are no slack variables to flip along with
+# the real ones
+# the temperature goes down geometrically over `sweeps` (or over time_budget seconds, whichever ends first), a zero
+# temperature sweep then settles every chain in a local minimum; the best feasible one is returned, when no chain is
+# feasible they are repaired greedily first
+class AnnealingComputer(HamiltonianComputer):
+    constrained = True
+
+    def __init__(self, chains: int = 32, sweeps: int = 500, time_budget: Optional[float] = None, seed: int = 1234,
+                 t_start: Optional[float] = None, t_stop: Optional[float] = None):
+        self.chains = chains
+        self.sweeps = sweeps
+        self.time_budget = time_budget
+        self.seed = seed
+        self.t_start = t_start
+        self.t_stop = t_stop
+
+    # energy (to minimize) of the objective up to its constant: linear @ x + x @ couplings @ x / 2,
+    # couplings are symmetric with a zero diagonal (x_i^2 = x_i goes to linear)
+    def energy_terms(qp: QuadraticProgram) -> tuple[np.ndarray, np.ndarray]:
+        sense = qp.objective.sense.value
+        upper = qp.objective.quadratic.to_array() * sense
+        linear = qp.objective.linear.to_array() * sense + np.diag(upper)
+        np.fill_diagonal(upper, 0)
+        return linear, upper + upper.T
+
+    # rows of the linear constraints with their [lower, upper] bounds
+    def constraint_terms(qp: QuadraticProgram) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        if qp.get_num_quadratic_constraints() > 0 or qp.get_num_vars() != qp.get_num_binary_vars():
+            raise ValueError("AnnealingComputer solves binary programs with linear constraints only")
+        rows = np.array([x.linear.to_array() for x in qp.linear_constraints]).reshape(-1, qp.get_num_vars())
+        lower = np.array([-np.inf if x.sense.name == 'LE' else x.rhs for x in qp.linear_constraints], dtype=np.float64)
+        upper = np.array([np.inf if x.sense.name == 'GE' else x.rhs for x in qp.linear_constraints], dtype=np.float64)
+        return rows, lower, upper
+
+    def violation(sums: np.ndarray, lower: np.ndarray, upper: np.ndarray) -> np.ndarray:
+        return (np.maximum(lower - sums, 0) + np.maximum(sums - upper, 0)).sum(axis=-1)
+
+    # any violation weighs a whole penalty, so even an overshoot below the smallest coefficient never pays off
+    def penalized(state: Chains, sums: np.ndarray) -> np.ndarray:
+        violation = AnnealingComputer.violation(sums, state.lower, state.upper)
+        return state.penalty * ((violation > 0) + violation / state.unit)
+
+    # greedy colouring, every variable takes the first colour none of its neighbours has
+    def colours(couplings: np.ndarray) -> list[Colour]:
+        colour = np.full(len(couplings), -1, dtype=np.int64)
+        for i, row in enumerate(couplings):
+            taken = set(colour[np.flatnonzero(row)].tolist())
+            colour[i] = next(c for c in range(len(couplings) + 1) if c not in taken)
+        classes = []
+        for c in range(colour.max(initial=-1) + 1):
+            members = np.flatnonzero(colour == c)
+            block = couplings[members].T
+            columns = np.flatnonzero(np.any(block != 0, axis=1))
+            degree = int((block[columns] != 0).sum(axis=1).max(initial=0))
+            positions = np.full((len(columns), degree), len(members), dtype=np.int64)
+            values = np.zeros((len(columns), degree))
+            for row, column in enumerate(columns.tolist()):
+                coupled = np.flatnonzero(block[column])
+                positions[row, :len(coupled)], values[row, :len(coupled)] = coupled, block[column, coupled]
+            classes.append(Colour(members, columns, positions, values))
+        return classes
+
+    # greatest / smallest energy change a flip can make, temperatures start and end there unless given
+    def temperatures(self, linear: np.ndarray, couplings: np.ndarray) -> tuple[float, float]:
+        reach = np.abs(linear) + np.abs(couplings).sum(axis=1)
+        reach = reach[reach > 0]
+        if len(reach) == 0:
+            return 1.0, 1.0
+        return self.t_start if self.t_start is not None else float(reach.max()), self.t_stop if self.t_stop is not None else float(reach.min()) / 100
+
+    # one sweep over all colour classes, temperature 0 only takes flips that lower the energy
+    # flips of a class are proposed against the same constraint sums; a chain takes them one after another up to the
+    # first one the flips before it have made more expensive, so taking several at once never walks out of a constraint
+    # unnoticed
+    def sweep(state: Chains, temperature: float, rng: np.random.Generator) -> int:
+        x, field = state.x, state.field
+        constrained = len(state.lower) > 0
+        flips = 0
+        for colour in state.colours:
+            i = colour.members
+            sign = 1 - 2 * x[:, i]
+            delta = sign * (state.linear[i] + field[:, i])
+            if constrained:
+                before = AnnealingComputer.penalized(state, state.sums)[:, None]
+                steps = sign[:, :, None] * state.rows[:, i].T
+                alone = AnnealingComputer.penalized(state, state.sums[:, None, :] + steps) - before
+                delta = delta + alone
+            accept = delta < 0
+            if temperature > 0:
+                accept |= rng.random(delta.shape) < np.exp(-np.maximum(delta, 0) / temperature)
+            if not accept.any():
+                continue
+            if constrained:
+                # accepted flips of a chain in order of energy change perturbed by the temperature (Gumbel noise: random
+                # while hot, lowest change first when cold), up to the first one the flips before it made more expensive
+                noise = -temperature * np.log(-np.log(rng.random(delta.shape))) if temperature > 0 else 0
+                order = np.argsort(np.where(accept, delta - noise, np.inf), axis=1, kind='stable')
+                taken = np.take_along_axis(accept, order, axis=1)
+                moved = state.sums[:, None, :] + np.cumsum(np.where(taken[:, :, None], np.take_along_axis(steps, order[:, :, None], axis=1), 0), axis=1)
+                penalties = AnnealingComputer.penalized(state, moved)
+                exact = penalties - np.concatenate((before, penalties[:, :-1]), axis=1)
+                worse = taken & (exact > np.take_along_axis(alone, order, axis=1) + 1e-9 * state.penalty)
+                first = np.where(worse.any(axis=1), worse.argmax(axis=1), len(i))
+                np.put_along_axis(accept, order, taken & (np.arange(len(i)) < first[:, None]), axis=1)
+                state.sums = state.sums + np.where(accept[:, :, None], steps, 0).sum(axis=1)
+            flips += int(accept.sum())
+            x[:, i] ^= accept
+            if len(colour.columns) > 0:
+                moves = np.vstack((np.where(accept, sign, 0).T, np.zeros((1, len(x)), dtype=np.int64)))
+                field[:, colour.columns] += np.einsum('cdk,cd->kc', moves[colour.positions], colour.values)
+        return flips
+
+    def anneal(self, qp: QuadraticProgram) -> np.ndarray:
+        rng = np.random.default_rng(self.seed)
+        linear, couplings = AnnealingComputer.energy_terms(qp)
+        rows, lower, upper = AnnealingComputer.constraint_terms(qp)
+        t_start, t_stop = self.temperatures(linear, couplings)
+        x = rng.integers(0, 2, (self.chains, len(linear)), dtype=np.int64)
+        # leaving a constraint costs more than the largest flip can gain
+        penalty = 2 * max(t_start, float((np.abs(linear) + np.abs(couplings).sum(axis=1)).max(initial=0)))
+        coefficients = np.abs(rows[rows != 0])
+        unit = float(coefficients.min()) if len(coefficients) > 0 else 1.0
+        state = Chains(x, x @ couplings, x @ rows.T, linear, AnnealingComputer.colours(couplings), rows, lower, upper, unit, penalty)
+
+        start = time.perf_counter()
+        for step in range(self.sweeps):
+            progress = step / max(1, self.sweeps - 1)
+            if self.time_budget is not None:
+                progress = max(progress, (time.perf_counter() - start) / self.time_budget)
+            if progress > 1:
+                break
+            AnnealingComputer.sweep(state, t_start * (t_stop / t_start) ** progress, rng)
+        for _ in range(len(linear) + 1):
+            if AnnealingComputer.sweep(state, 0, rng) == 0:
+                break
+        return state.x
+
+    # flips the variable that loses the least energy per unit of violation it removes until the state is feasible
+    def repair(qp: QuadraticProgram, x: np.ndarray) -> np.ndarray:
+        linear, couplings = AnnealingComputer.energy_terms(qp)
+        rows, lower, upper = AnnealingComputer.constraint_terms(qp)
+        x = x.copy()
+        sums = rows @ x
+        violation = AnnealingComputer.violation(sums, lower, upper)
+        while violation > 0:
+            sign = 1 - 2 * x
+            moved = sums + sign[:, None] * rows.T
+            removed = violation - AnnealingComputer.violation(moved, lower, upper)
+            if not (removed > 0).any():
+                raise ValueError(f"no state within {', '.join(f'{c.name} {c.rhs}' for c in qp.linear_constraints)}")
+            cost = np.where(removed > 0, sign * (linear + couplings @ x) / np.where(removed > 0, removed, 1), np.inf)
+            i = int(np.argmin(cost))
+            x[i] ^= 1
+            sums, violation = moved[i], violation - removed[i]
+        return x
+
+    def solve(self, qp: QuadraticProgram) -> VarState:
+        names = [x.name for x in qp.variables]
+        if len(names) == 0:
+            return {}
+        linear, couplings = AnnealingComputer.energy_terms(qp)
+        rows, lower, upper = AnnealingComputer.constraint_terms(qp)
+        chains = self.anneal(qp)
+        feasible = AnnealingComputer.violation(chains @ rows.T, lower, upper) <= 1e-9
+        if not feasible.any():
+            chains = np.array([AnnealingComputer.repair(qp, x) for x in chains])
+            feasible[:] = True
+        energy = chains @ linear + np.einsum('ci,ci->c', chains @ couplings, chains) / 2
+        best = chains[np.argmin(np.where(feasible, energy, np.inf))]
+        return {name: int(x) for name, x in zip(names, best)}
+
+    def maximize(self, formula: Sum | Formula) -> VarState:
+        return self.solve(HamiltonianComputer.formulate_problem(formula))
@@ -0,0 +1,118 @@
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Iterable, Optional
+import numpy as np
+
+from comp import Computer
+from portfolio import ActingPosition, AssetBlock, optimize_agg
+from testutil import BacktestConfig, Market, Report, RiskModel, get_price, read_portfolio
+from instrument import span
+
+
+# backtesting of suggested actions against actual t1 prices (projections where there is no price)
+# every unit is classified through name lookups and all future values are computed as columns over the units,
+# t1 prices are looked up once per ticker
+
+NONE, BUY, SELL = 0, 1, 2
+action_names = np.array(["NONE", "BUY", "SELL"], dtype=object)
+
+@dataclass
+class Backtest:
+    actions: list[str] # names of the units acted upon
+    report: list[Report]
+    future_value_without_action: float
+    future_value_with_action: float
+
+# per unit columns (positions are units among the assets of interest)
+@dataclass(eq=False)
+class Units:
+    names: list[str]
+    tickers: list[str]
+    held: np.ndarray
+    price_t: np.ndarray
+    integral: np.ndarray # price_t is an int
+    swing_up: np.ndarray
+    swing_down: np.ndarray
+
+    def of_market(market: Market) -> 'Units':
+        held = {x.asset.name for x in market.positions}
+        assets = market.assets_of_interest
+        return Units([x.name for x in assets], [x.ticker for x in assets],
+                     np.array([x.name in held for x in assets], dtype=bool),
+                     np.array([x.price_t for x in assets], dtype=np.float64),
+                     np.array([isinstance(x.price_t, int) for x in assets], dtype=bool),
+                     np.array([x.swing_up for x in assets], dtype=np.float64),
+                     np.array([x.swing_down for x in assets], dtype=np.float64))
+
+    def of_block(block: AssetBlock) -> 'Units':
+        index = np.arange(len(block)) - np.repeat(block.offsets[:-1], block.units)
+        return Units([t + "#" + str(i) for t, i in zip(np.repeat(block.tickers, block.units).tolist(), index.tolist())],
+                     np.repeat(block.tickers, block.units).tolist(),
+                     index < np.repeat(block.held, block.units),
+                     np.repeat(block.price_t, block.units).astype(np.float64),
+                     np.full(len(block), block.price_t.dtype.kind in 'iu'),
+                     np.repeat(block.swing_up, block.units).astype(np.float64),
+                     np.repeat(block.swing_down, block.units).astype(np.float64))
+
+# acting on a held unit sells it, on any other unit buys it
+def classify(units: Units, actions: Iterable[str]) -> np.ndarray:
+    acted = set(actions)
+    codes = np.array([x in acted for x in units.names], dtype=np.int8)
+    return np.where(units.held, codes * SELL, codes * BUY)
+
+# t1 price per unit and whether it is an actual price (None where the ticker has none)
+def prices_t1(units: Units, t1: datetime) -> tuple[np.ndarray, np.ndarray]:
+    found = {t: get_price(t1, t) for t in dict.fromkeys(units.tickers)}
+    price = np.array([found[t] for t in units.tickers], dtype=np.float64)
+    return np.nan_to_num(price), ~np.isnan(price)
+
+# python ints where a value comes from ints only, so the report reads as before (129, not 129.0)
+def exact(values: np.ndarray, integral: np.ndarray) -> list:
+    result = values.astype(object)
+    result[integral] = values[integral].astype(np.int64).astype(object)
+    return result.tolist()
+
+# buy at t0 and sell at t1 (immediate zero-interest loan assumed), sell at t0, or hold and sell at t1
+# future value without action counts only the held units, with action - every unit of interest
+def backtest(market: Market | AssetBlock, actions: Iterable[str], t1: datetime, point_to_unit: int) -> Backtest:
+    with span('backtest'):
+        units = Units.of_block(market) if isinstance(market, AssetBlock) else Units.of_market(market)
+        actions = list(actions)
+        codes = classify(units, actions)
+        price_t1, found = prices_t1(units, t1)
+
+        # we take projection in absense of data
+        projected_up = units.price_t + units.price_t * units.swing_up / 100
+        projected_down = units.price_t - units.price_t * units.swing_down / 100
+        t1_value = np.where(found, price_t1, projected_down)
+
+        action_fv = np.select([codes == BUY, codes == SELL], [np.where(found, price_t1, projected_up) - units.price_t, units.price_t], t1_value)
+        action_integral = np.select([codes == BUY, codes == SELL], [found & units.integral, units.integral], found)
+        no_action_fv = np.where(units.held, t1_value, 0)
+
+        scaled = isinstance(point_to_unit, (int, np.integer))
+        fv_action = action_fv * point_to_unit
+        fv_no_action = no_action_fv * point_to_unit
+        fv_action_integral = action_integral & scaled
+        fv_no_action_integral = ~units.held | (found & scaled)
+
+        report = list(map(Report, units.names, units.held.tolist(),
+                          exact(units.price_t, units.integral), exact(t1_value, found), action_names[codes].tolist(),
+                          exact(fv_no_action, fv_no_action_integral), exact(fv_action, fv_action_integral),
+                          exact(fv_action - fv_no_action, fv_action_integral & fv_no_action_integral)))
+        return Backtest(actions, report, float(no_action_fv.sum() * point_to_unit), float(action_fv.sum() * point_to_unit))
+
+def dates(cfg: BacktestConfig) -> tuple[datetime, datetime]:
+    return datetime(cfg.t0y, cfg.t0m, cfg.t0d), datetime(cfg.t1y, cfg.t1m, cfg.t1d)
+
+def read_market(cfg: BacktestConfig, path: str = 'example_portfolio.csv') -> Market:
+    t0, t1 = dates(cfg)
+    return read_portfolio(limit = cfg.limit, point_to_unit = cfg.point_to_unit, t0 = t0, t1 = t1, risk = RiskModel(cfg.risk_lev, cfg.risk_spre), path = path)
+
+# optimizes the market of the config (read unless given) on the computer and backtests the actions
+def run(cfg: BacktestConfig, computer: Computer, workers: int = 1, market: Optional[Market] = None, budget: Optional[float] = None) -> Backtest:
+    _, t1 = dates(cfg)
+    if market is None:
+        market = read_market(cfg)
+    actions: Iterable[ActingPosition] = optimize_agg(cfg.qbits, computer, market.positions, market.assets_of_interest, workers = workers, budget = budget)
+    return backtest(market, (x.asset.name for x in actions), t1, cfg.point_to_unit)
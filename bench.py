@@ -0,0 +1,160 @@
+import argparse
+import csv
+import os
+import platform
+import random
+import resource
+import statistics
+import sys
+import tempfile
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+import multiprocessing
+
+from comp import *
+from portfolio import *
+from testutil import read_portfolio, dump, load
+from engines import engine
+import instrument
+
+
+# benchmark suite: scaling of every Computer engine and of optimize / optimize_agg
+# python3 bench.py [--quick] [--engines cla,cla_vec] [--save-baseline]
+# results go to bench_results.json, timings are compared against bench_baseline.json (if present)
+
+# largest formula each engine is swept up to (brute force and statevector grow as 2^n)
+max_vars = {"cla": 14, "cla_vec": 24, "ham_c": 12, "ham_q": 6, "grover": 4, "knap": 24, "anneal": 24}
+
+
+# records latency of every chunk the wrapped computer solves
+class TimedComputer(Computer):
+    def __init__(self, computer: Computer):
+        self.computer = computer
+        self.batched = computer.batched
+        self.batch_size = computer.batch_size
+        self.latencies: list[float] = []
+
+    def maximize(self, formula: Sum | Formula) -> VarState:
+        start = time.perf_counter()
+        state = self.computer.maximize(formula)
+        self.latencies.append(time.perf_counter() - start)
+        return state
+
+    def maximize_many(self, formulas: list[Sum | Formula]) -> list[VarState]:
+        start = time.perf_counter()
+        states = self.computer.maximize_many(formulas)
+        self.latencies += [(time.perf_counter() - start) / len(formulas)] * len(formulas)
+        return states
+
+
+# portfolio with the columns of example_portfolio.csv, allocations are whole percent points so every ticker has units
+def synthetic_portfolio(path: str, rows: int, seed: int = 0):
+    sectors = ["Technology", "Healthcare", "Energy", "Financials", "Industrials", "Consumer Staples", "Automotive"]
+    rng = random.Random(seed)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['company', 'ticker', 'sector', 'allocation', 'allocation_usd'])
+        for i in range(rows):
+            allocation = rng.uniform(1, 5)
+            writer.writerow(['Synthetic ' + str(i), 'SYN' + str(i), rng.choice(sectors), allocation, allocation * 10000000])
+
+def random_formula(n: int, seed: int = 0) -> Formula:
+    rng = random.Random(seed)
+    return Formula(['x' + str(i) for i in range(n)], np.array([rng.uniform(-100, 100) for _ in range(n)]))
+
+def latency_stats(latencies: list[float]) -> dict[str, float]:
+    if len(latencies) == 0:
+        return {}
+    ordered = sorted(latencies)
+    return {"count": len(ordered), "mean": statistics.fmean(ordered), "p50": ordered[len(ordered) // 2],
+            "p95": ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], "max": ordered[-1]}
+
+
+Case = dict[str, object]
+
+def run_case(case: Case) -> Case:
+    # warnings are silenced for the case only, isolate=False runs it in the caller's process
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore")
+        computer = TimedComputer(engine(case["engine"]))
+        start = time.perf_counter()
+        match case["kind"]:
+            case "maximize":
+                computer.maximize(random_formula(case["vars"]))
+            case "optimize":
+                market = read_portfolio(limit=case["units"], point_to_unit=case["point_to_unit"], path=case["path"])
+                optimize(computer, market.positions, market.assets_of_interest)
+            case "optimize_agg":
+                market = read_portfolio(limit=case["units"], point_to_unit=case["point_to_unit"], path=case["path"])
+                list(optimize_agg(case["qbits"], computer, market.positions, market.assets_of_interest))
+        wall = time.perf_counter() - start
+    return case | {"wall": wall, "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, "chunk_latency": latency_stats(computer.latencies)}
+
+def case_key(case: Case) -> str:
+    return "/".join(f"{k}={case[k]}" for k in ["kind", "engine", "vars", "units", "qbits"] if k in case)
+
+def plan(engines: list[str], quick: bool, path: str) -> list[Case]:
+    cases = []
+    for name in engines:
+        sizes = range(2, max_vars[name] + 1, 4 if quick else 2)
+        cases += [{"kind": "maximize", "engine": name, "vars": n} for n in sizes]
+        cases += [{"kind": "optimize", "engine": name, "units": n, "point_to_unit": 1, "path": path} for n in sizes if n <= 12]
+        for qbits in ([3] if quick else [2, 3, 4, 6]):
+            if qbits > max_vars[name]:
+                continue
+            for units in ([60] if quick else [60, 600, 6000]):
+                if name in ["ham_q", "grover"] and units > 60:
+                    continue
+                cases.append({"kind": "optimize_agg", "engine": name, "qbits": qbits, "units": units, "point_to_unit": 100, "path": path})
+    return cases
+
+# every case runs in a fresh process, so peak RSS belongs to that case only
+def run(cases: list[Case], isolate: bool = True) -> list[Case]:
+    if not isolate:
+        return [run_case(case) for case in cases]
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for case in cases:
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+            results.append(pool.submit(run_case, case).result())
+        print(f"{case_key(case):<55} {results[-1]['wall']:.4f}s", file=sys.stderr)
+    return results
+
+# cases slower than baseline by more than tolerance (and by more than min_delta seconds)
+def regressions(results: list[Case], baseline: list[Case], tolerance: float = 0.25, min_delta: float = 0.01) -> list[tuple[str, float, float]]:
+    reference = {case_key(x): x["wall"] for x in baseline}
+    return [(case_key(x), reference[case_key(x)], x["wall"]) for x in results
+            if case_key(x) in reference and x["wall"] > reference[case_key(x)] * (1 + tolerance) and x["wall"] - reference[case_key(x)] > min_delta]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="benchmarks Computer engines and the optimize pipeline")
+    parser.add_argument("--engines", default="cla,cla_vec,ham_c,ham_q")
+    parser.add_argument("--quick", action="store_true")
+    parser.add_argument("--inline", action="store_true", help="run cases in this process (peak RSS is then cumulative)")
+    parser.add_argument("--output", default="bench_results")
+    parser.add_argument("--baseline", default="bench_baseline")
+    parser.add_argument("--save-baseline", action="store_true")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'synthetic_portfolio.csv')
+        synthetic_portfolio(path, 200)
+        results = run(plan(args.engines.split(","), args.quick, path), not args.inline)
+
+    for x in results:
+        x.pop("path", None)
+    report = {"meta": {"date": datetime.now().isoformat(), "python": platform.python_version(), "machine": platform.machine(), "cpus": os.cpu_count()},
+              "results": results}
+    dump(args.output, report)
+    instrument.report()
+    if args.save_baseline:
+        dump(args.baseline, report)
+    elif os.path.exists(args.baseline + '.json'):
+        slower = regressions(results, load(args.baseline)["results"], args.tolerance)
+        for key, before, after in slower:
+            print(f"REGRESSION {key}: {before:.4f}s -> {after:.4f}s")
+        sys.exit(1 if len(slower) > 0 else 0)
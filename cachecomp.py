@@ -0,0 +1,99 @@
+from collections import OrderedDict
+from typing import Optional
+import inspect
+import json
+import os
+
+from comp import *
+
+
+# wraps another computer and remembers its solutions (LRU), optionally persisted as json between runs
+# formulas are cached by their sorted weights, so chunks that differ only in variable names (units of one ticker,
+# repeated backtests) are solved once and the cached assignment is mapped onto the new names
+# keys start with the engine and its constructor options, so an engine configured differently (seed, sweeps,
+# precision) never gets another one's solutions; batched engines get all misses of a batch in one maximize_many
+class CachingComputer(Computer):
+    def __init__(self, computer: Computer, capacity: int = 4096, path: Optional[str] = None):
+        self.computer = computer
+        self.capacity = capacity
+        self.path = path
+        self.engine = CachingComputer.describe(computer)
+        self.solutions: OrderedDict[str, list[int]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        if path is not None and os.path.exists(path):
+            with open(path) as f:
+                self.solutions.update(json.load(f))
+
+    # class name and constructor options (attributes named after the parameters), objects by their type only
+    def describe(computer: Computer) -> str:
+        options = []
+        for name in inspect.signature(type(computer).__init__).parameters:
+            if name != 'self' and hasattr(computer, name):
+                value = getattr(computer, name)
+                options.append(f'{name}={value!r}' if isinstance(value, (bool, int, float, str, tuple, type(None))) else f'{name}={type(value).__name__}')
+        return type(computer).__name__ + '(' + ','.join(options) + ')'
+
+    # key of the formula and the variable order it was taken in (stable sort, ties keep formula order)
+    # quadratic terms are keyed by the positions of their variables in that order, costs (with a budget) in that order
+    def signature(self, formula: Formula) -> tuple[str, np.ndarray]:
+        order = np.argsort(formula.weights, kind='stable')
+        key = self.engine + ':' + ','.join(map(repr, formula.weights[order].tolist()))
+        if not formula.is_linear():
+            position = np.empty(len(order), dtype=np.int64)
+            position[order] = np.arange(len(order))
+            pairs = np.sort(position[formula.pairs], axis=1)
+            terms = sorted(zip(pairs[:, 0].tolist(), pairs[:, 1].tolist(), formula.couplings.tolist()))
+            key += ';' + ','.join(f'{i}-{j}:{x!r}' for i, j, x in terms)
+        if formula.budget is not None:
+            key += f';{formula.budget!r}:' + ','.join(map(repr, formula.costs[order].tolist()))
+        return key, order
+
+    @property
+    def constrained(self) -> bool:
+        return self.computer.constrained
+
+    @property
+    def batched(self) -> bool:
+        return self.computer.batched
+
+    @property
+    def batch_size(self) -> int:
+        return self.computer.batch_size
+
+    def maximize(self, formula: Sum | Formula) -> VarState:
+        return self.maximize_many([formula])[0]
+
+    # formulas missing from the cache are solved together, each distinct key once
+    def maximize_many(self, formulas: list[Sum | Formula]) -> list[VarState]:
+        formulas = [Formula.compile(x) for x in formulas]
+        signatures = [self.signature(x) for x in formulas]
+        missing: dict[str, int] = {}
+        for i, (key, _) in enumerate(signatures):
+            if key in self.solutions or key in missing:
+                self.hits += 1
+            else:
+                self.misses += 1
+                missing[key] = i
+        solved = self.computer.maximize_many([formulas[i] for i in missing.values()]) if missing else []
+        found = {key: [int(state[formulas[i].names[j]]) for j in signatures[i][1]] for (key, i), state in zip(missing.items(), solved)}
+
+        states = []
+        for formula, (key, order) in zip(formulas, signatures):
+            bits = found[key] if key in found else self.solutions[key]
+            states.append({formula.names[i]: b for i, b in zip(order.tolist(), bits)})
+        for key in dict.fromkeys(key for key, _ in signatures):
+            if key in found:
+                self.solutions[key] = found[key]
+            self.solutions.move_to_end(key)
+        while len(self.solutions) > self.capacity:
+            self.solutions.popitem(last=False)
+        return states
+
+    def stats(self) -> dict[str, int]:
+        return {'hits': self.hits, 'misses': self.misses, 'size': len(self.solutions)}
+
+    def save(self):
+        if self.path is not None:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump(self.solutions, f)
@@ -2,22 +2,77 @@ from dataclasses import dataclass
 
 from comp import *
 import itertools
+import numpy as np
+from typing import Optional
 
 class ClassicComputer(Computer):
+    constrained = True
 
-    def calculate(formula: Sum, varstate: VarState, acc: int = 0) -> int: 
-         while True:
-            match formula:
-                case Sum(Zero(), Mul(x, name)):
-                    return x * varstate[name] + acc
-                case Sum(next, Mul(x, name)):
-                    formula = next
-                    acc = x * varstate[name] + acc
-
-    def maximize(self, formula: Sum) -> VarState:
-        vars = Computer.extract_vars(formula)
+    def calculate(formula: Sum | Formula, varstate: VarState, acc: int = 0) -> int: 
+        formula = Formula.compile(formula)
+        for x, name in zip(reversed(formula.weights.tolist()), reversed(formula.names)):
+            acc = x * varstate[name] + acc
+        for x, (i, j) in zip(formula.couplings.tolist(), formula.pairs.tolist()):
+            acc = x * varstate[formula.names[i]] * varstate[formula.names[j]] + acc
+        return acc
+
+    def maximize(self, formula: Sum | Formula) -> VarState:
+        formula = Formula.compile(formula)
+        vars = formula.names
         combos = list(itertools.product([0, 1], repeat = len(vars)))
+        if formula.budget is not None:
+            combos = [v for v in combos if np.dot(v, formula.costs) <= formula.budget]
+            if len(combos) == 0:
+                raise ValueError(f"no state within budget {formula.budget}")
         dict = [{vars[i]: v[i] for i in range(len(vars))} for v in combos]
         values = [(state, ClassicComputer.calculate(formula, state)) for state in dict]
         return max(values, key=lambda x: x[1])[0]
-        
+
+
+# same permutation as ClassicComputer, but states are scored block by block (2^block_bits bit patterns at a time) with numpy
+# only the best state seen so far is kept, so memory does not depend on the number of variables
+class VectorizedClassicComputer(Computer):
+    def __init__(self, block_bits: int = 16):
+        self.block_bits = block_bits
+
+    # rows are bit patterns of `width` variables, first variable is the most significant bit (itertools.product order)
+    def bit_patterns(width: int, start: int = 0, count: Optional[int] = None) -> np.ndarray:
+        states = np.arange(start, start + (count if count is not None else 1 << width), dtype=np.int64)
+        shifts = np.arange(width - 1, -1, -1, dtype=np.int64)
+        return ((states[:, None] >> shifts) & 1).astype(np.int8)
+
+    def maximize(self, formula: Sum | Formula) -> VarState:
+        formula = Formula.compile(formula)
+        names = formula.names
+        w = formula.weights.astype(np.float64)
+        n = len(names)
+        low = min(n, self.block_bits)
+        high = n - low
+
+        # low bits are the same in every block, only the high prefix changes
+        low_patterns = VectorizedClassicComputer.bit_patterns(low)
+        low_scores = low_patterns @ w[high:]
+
+        # quadratic terms: low-low ones are added to low_scores once, high-low ones become linear in the low bits per prefix
+        c = formula.couplings.astype(np.float64)
+        first, second = formula.pairs.min(axis=1), formula.pairs.max(axis=1)
+        both_low, mixed, both_high = first >= high, (first < high) & (second >= high), second < high
+        if both_low.any():
+            low_scores = low_scores + (low_patterns[:, first[both_low] - high] * low_patterns[:, second[both_low] - high]) @ c[both_low]
+
+        best_score, best_state = None, 0
+        for prefix in range(1 << high):
+            prefix_bits = VectorizedClassicComputer.bit_patterns(high, prefix, 1)[0]
+            scores = low_scores + prefix_bits @ w[:high]
+            if mixed.any():
+                v = np.zeros(low)
+                np.add.at(v, second[mixed] - high, c[mixed] * prefix_bits[first[mixed]])
+                scores = scores + low_patterns @ v + prefix_bits[first[both_high]] * prefix_bits[second[both_high]] @ c[both_high]
+            elif both_high.any():
+                scores = scores + prefix_bits[first[both_high]] * prefix_bits[second[both_high]] @ c[both_high]
+            i = int(np.argmax(scores))
+            if best_score is None or scores[i] > best_score:
+                best_score, best_state = scores[i], (prefix << low) | i
+
+        bits = VectorizedClassicComputer.bit_patterns(n, best_state, 1)[0]
+        return {names[i]: int(bits[i]) for i in range(n)}
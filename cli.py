@@ -0,0 +1,69 @@
+import argparse
+import warnings
+from dataclasses import replace
+
+import backtest
+import engines
+import instrument
+from portfolio import optimize_agg
+from testutil import BacktestConfig, dump, dump_csv_report, load
+
+
+# optimization and backtests from a config, only the engine it names is imported
+# python3 cli.py optimize --config backtest_config --computer cla --set limit=20
+# python3 cli.py backtest --computer cla --workers 4 --report
+# python3 cli.py engines
+
+def config(args: argparse.Namespace) -> BacktestConfig:
+    base = BacktestConfig(**load(args.config))
+    changes = {}
+    for item in args.set:
+        field, value = item.split("=")
+        changes[field] = type(getattr(base, field))(value)
+    if args.computer is not None:
+        changes["computer"] = args.computer
+    return replace(base, **changes)
+
+def optimize(args: argparse.Namespace):
+    cfg = config(args)
+    market = backtest.read_market(cfg, args.portfolio)
+    actions = [x.asset.name for x in optimize_agg(cfg.qbits, engines.engine(cfg.computer), market.positions, market.assets_of_interest, workers = args.workers, budget = args.budget)]
+    if args.output is not None:
+        dump(args.output, actions)
+    print("\n".join(actions))
+
+def run_backtest(args: argparse.Namespace):
+    cfg = config(args)
+    result = backtest.run(cfg, engines.engine(cfg.computer), args.workers, backtest.read_market(cfg, args.portfolio), args.budget)
+    if args.report:
+        dump('actions_backtesting', result.actions)
+        dump_csv_report(result.report)
+    print(f"actions: {len(result.actions)}")
+    print(f"future value without action: {result.future_value_without_action}")
+    print(f"future value with action: {result.future_value_with_action}")
+
+def parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="runs the optimizer or a backtest from a config")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("engines", help="lists engine names")
+    for name, run, help in [("optimize", optimize, "prints suggested actions"), ("backtest", run_backtest, "backtests suggested actions")]:
+        command = commands.add_parser(name, help=help)
+        command.set_defaults(run=run)
+        command.add_argument("--config", default="backtest_config", help="config (json, without extension)")
+        command.add_argument("--computer", choices=engines.names(), help="overrides the engine of the config")
+        command.add_argument("--set", action="append", default=[], help="field=value, overrides a config field")
+        command.add_argument("--workers", type=int, default=1)
+        command.add_argument("--budget", type=float, help="cash the actions may spend (constrained engines: cla, knap, anneal)")
+        command.add_argument("--portfolio", default="example_portfolio.csv")
+    commands.choices["optimize"].add_argument("--output", help="dumps actions to this json (without extension)")
+    commands.choices["backtest"].add_argument("--report", action="store_true", help="writes actions_backtesting.json and report.csv")
+    return parser
+
+if __name__ == '__main__':
+    args = parser().parse_args()
+    if args.command == "engines":
+        print("\n".join(engines.names()))
+    else:
+        warnings.filterwarnings("ignore", category=DeprecationWarning)
+        args.run(args)
+        instrument.report()
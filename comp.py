@@ -1,47 +1,116 @@
 from __future__ import annotations
-from dataclasses import dataclass
+from dataclasses import dataclass, field
 from abc import ABC, abstractmethod
+from concurrent.futures import Executor
+from typing import Optional
+import asyncio
+import numpy as np
 
 
 # DSL
 
-@dataclass
+@dataclass(slots=True)
 class Zero:
     pass
 
-@dataclass
+@dataclass(slots=True)
 class Sum:
     a: Sum | Zero
-    b: Mul
+    b: Mul | Quad
 
 
 Const = int
 VarName = str # reference to a binary variable
 
-@dataclass
+@dataclass(slots=True)
 class Mul:
     a: Const
     b: VarName
 
+# a * b * c, b and c are different variables
+@dataclass(slots=True)
+class Quad:
+    a: Const
+    b: VarName
+    c: VarName
+
 VarState = dict[str, int]
 VarNames  = list[str]
 
+
+# compiled form of the DSL: a flat weighted sum, i-th variable is multiplied by i-th weight
+# quadratic terms (if any) are couplings[k] * x[pairs[k, 0]] * x[pairs[k, 1]]
+# with a budget, costs of the variables set to 1 must sum to at most budget (only constrained computers honour it)
+# Sum/Mul/Quad chains are lowered into it once, computers read the arrays directly
+@dataclass(eq=False)
+class Formula:
+    names: VarNames
+    weights: np.ndarray
+    pairs: np.ndarray = field(default_factory=lambda: np.zeros((0, 2), dtype=np.int64))
+    couplings: np.ndarray = field(default_factory=lambda: np.zeros(0))
+    costs: np.ndarray = field(default_factory=lambda: np.zeros(0))
+    budget: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def is_linear(self) -> bool:
+        return len(self.couplings) == 0
+
+    def compile(formula: Sum | Zero | Formula) -> Formula:
+        if isinstance(formula, Formula):
+            return formula
+        if isinstance(formula, Zero):
+            return Formula([], np.zeros(0))
+        names, weights, quads = [], [], []
+        while True:
+            match formula:
+                case Sum(next, Mul(x, name)):
+                    names.append(name)
+                    weights.append(x)
+                case Sum(next, Quad(x, a, b)):
+                    quads.append((x, a, b))
+            if isinstance(next, Zero):
+                break
+            formula = next
+        compiled = Formula(names[::-1], np.asarray(weights[::-1]))
+        if len(quads) > 0:
+            # variables that only appear in quadratic terms get a zero weight
+            index = {}
+            for i, name in enumerate(compiled.names):
+                index.setdefault(name, i)
+            for _, a, b in quads[::-1]:
+                for name in (a, b):
+                    if name not in index:
+                        index[name] = len(compiled.names)
+                        compiled.names.append(name)
+            if len(compiled.names) > len(compiled.weights):
+                compiled.weights = np.concatenate((compiled.weights, np.zeros(len(compiled.names) - len(compiled.weights))))
+            compiled.pairs = np.array([(index[a], index[b]) for _, a, b in quads[::-1]], dtype=np.int64)
+            compiled.couplings = np.asarray([x for x, _, _ in quads[::-1]])
+        return compiled
+
+
 # abstract class representing any computer capable of running unconstrained solver
 # note: as with Langrangians, Hamiltonian constrained problems (budget for instance) can be converted to unconstrained ones, using penalties
 class Computer(ABC):
+    batched = False # maximize_many submits all formulas as one job (see optimize_agg)
+    batch_size = 64
+    constrained = False # maximize honours Formula.budget
 
-    def extract_vars(formula: Sum, acc: VarNames = []) -> VarNames:
-        while True:
-            match formula:
-                case Sum(Zero(), Mul(_, name)):
-                    return [name] + acc
-                case Sum(next, Mul(_, name)):
-                    formula = next
-                    acc = [name] + acc
+    def extract_vars(formula: Sum | Formula) -> VarNames:
+        return Formula.compile(formula).names
 
     @abstractmethod
-    def maximize(self, formula: Sum) -> VarState:
+    def maximize(self, formula: Sum | Formula) -> VarState:
         # extract vars
         # bruteforce evaluations
         # find minimum
-        pass
\ No newline at end of file
+        pass
+
+    def maximize_many(self, formulas: list[Sum | Formula]) -> list[VarState]:
+        return [self.maximize(formula) for formula in formulas]
+
+    # solves in executor (the loop's default thread pool if None), the event loop isn't blocked meanwhile
+    async def maximize_async(self, formula: Sum | Formula, executor: Optional[Executor] = None) -> VarState:
+        return await asyncio.get_running_loop().run_in_executor(executor, self.maximize, formula)
@@ -0,0 +1,34 @@
+from typing import Callable
+import importlib
+
+from comp import Computer
+
+
+# engines by the names BacktestConfig.computer takes; a module is imported the first time one of its engines is created,
+# so classic runs never load qiskit (hamicomp, grocomp)
+# register("my", "mymodule", "MyComputer") plugs in another engine
+registry: dict[str, tuple[str, str]] = {
+    "cla": ("clacomp", "ClassicComputer"),
+    "cla_vec": ("clacomp", "VectorizedClassicComputer"),
+    "ham_c": ("hamicomp", "HamiltonianComputerClassicEigen"),
+    "ham_q": ("hamicomp", "HamiltonianComputerQuantum"),
+    "grover": ("grocomp", "GroverComputer"),
+    "knap": ("knapcomp", "KnapsackComputer"),
+    "anneal": ("annecomp", "AnnealingComputer"),
+}
+
+def register(name: str, module: str, attr: str):
+    registry[name] = (module, attr)
+
+def names() -> list[str]:
+    return list(registry)
+
+def factory(name: str) -> Callable[..., Computer]:
+    if name not in registry:
+        raise ValueError(f"unknown engine {name!r}, expected one of {', '.join(registry)}")
+    module, attr = registry[name]
+    return getattr(importlib.import_module(module), attr)
+
+# options go to the engine's constructor
+def engine(name: str, **options) -> Computer:
+    return factory(name)(**options)
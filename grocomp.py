@@ -1,10 +1,12 @@
+from collections import OrderedDict
+from typing import Generator
+import math
+
 from comp import *
 
 from qiskit import QuantumCircuit
-from qiskit.circuit.library import GroverOperator, MCMT, ZGate, WeightedAdder, IntegerComparator
-
+from qiskit.circuit.library import WeightedAdder, IntegerComparator, grover_operator
 
-# DRAFT!!!!
 
 # from qiskit_ibm_runtime import QiskitRuntimeService
 # from qiskit_ibm_runtime import SamplerV2 as Sampler
@@ -23,57 +25,151 @@ from qiskit.circuit.library import GroverOperator, MCMT, ZGate, WeightedAdder, I
 # https://egrettathula.wordpress.com/2023/04/18/efficient-quantum-comparator-circuit/
 
 Weights = list[int]
-
+Counts = dict[str, int]
+
+# Dürr–Høyer maximum finding: every round marks the states scoring above the best one seen so far
+# (WeightedAdder + IntegerComparator oracle) and keeps the best measured state; the number of Grover iterations follows
+# the BBHT schedule (uniformly random below a bound that starts at 1, grows by `growth` after a round without a marked
+# state and is reset by one with it), the search stops once nothing better can exist or `budget` * sqrt(2^n)
+# iterations are spent (22.5: found with probability at least 1/2 even for a single shot)
+# WeightedAdder takes non-negative integers: weights are scaled to `precision` bits and negative ones are flipped
+# (w * x = w + |w| * (1 - x)), measured states are compared on the exact weights
+# the simulator is created once, transpiled circuits are cached per (weights, threshold, iterations)
 class GroverComputer(Computer):
-    def __init__(self, threshold):
-        self.threshold = threshold
-
-    def extract_weights(formula: Sum, acc: Weights = []) -> Weights:
-        while True:
-            match formula:
-                case Sum(Zero(), Mul(x, name)):
-                    return [x] + acc
-                case Sum(next, Mul(x, name)):
-                    formula = next
-                    acc = [x] + acc
-
-    def build_curcuit(self, formula: Sum) -> QuantumCircuit:
-        qnum = len(Computer.extract_vars(formula))
-
-        oracle = QuantumCircuit(qnum + 1)
-
-        adder = WeightedAdder(qnum, GroverComputer.extract_weights(formula))
-        comp = IntegerComparator(qnum, self.threshold, geq=True, name='Comparator')
-        
-        oracle.h(qnum)
-        oracle.append(adder)
-        oracle.append(comp)
-
-        oracle.compose(MCMT(ZGate(), qnum - 1, 1), inplace=True)
-
-        qc = QuantumCircuit(qnum)
-        grover_op = GroverOperator(oracle)
-
-        qc.h(range(grover_op.num_qubits))
-
-        optimal_num_iterations = 100
-        qc.compose(grover_op.power(optimal_num_iterations), inplace=True)
+    def __init__(self, shots: int = 16, precision: int = 2, budget: float = 22.5, growth: float = 6 / 5, seed: int = 1234, cache_size: int = 64):
+        self.shots = shots
+        self.precision = precision
+        self.budget = budget
+        self.growth = growth
+        self.seed = seed
+        self.cache_size = cache_size
+        self.simulator = None
+        self.passes = None
+        self.circuits: OrderedDict[tuple, QuantumCircuit] = OrderedDict()
+
+    def __getstate__(self):
+        return self.__dict__ | {'simulator': None, 'passes': None, 'circuits': OrderedDict()}
+
+    def transpiled(self, weights: Weights, flipped: list[bool], threshold: int, iterations: int) -> QuantumCircuit:
+        from qiskit.transpiler.preset_passmanagers import generate_preset_pass_manager
+        from qiskit_aer import AerSimulator
 
-        qc.measure_all()
+        # the pass manager is built once, building the simulator target costs more than transpiling a small circuit
+        if self.simulator is None:
+            self.simulator = AerSimulator(max_parallel_experiments=0)
+            self.passes = generate_preset_pass_manager(optimization_level=2, backend=self.simulator)
+        key = (tuple(weights), tuple(flipped), threshold, iterations)
+        if key in self.circuits:
+            self.circuits.move_to_end(key)
+        else:
+            self.circuits[key] = self.passes.run(GroverComputer.build_circuit(weights, flipped, threshold, iterations))
+            if len(self.circuits) > self.cache_size:
+                self.circuits.popitem(last=False)
+        return self.circuits[key]
+
+    def extract_weights(formula: Sum | Formula) -> Weights:
+        return Formula.compile(formula).weights.tolist()
+
+    # |w| scaled so the largest one is 2^precision - 1 (non-zero weights stay non-zero) and which variables are flipped
+    def quantize(self, formula: Formula) -> tuple[Weights, list[bool]]:
+        w = np.asarray(GroverComputer.extract_weights(formula), dtype=np.float64)
+        top = np.abs(w).max(initial=0)
+        scaled = np.zeros(len(w), dtype=np.int64) if top == 0 else np.round(np.abs(w) * ((1 << self.precision) - 1) / top).astype(np.int64)
+        return np.where(w != 0, np.maximum(scaled, 1), 0).tolist(), (w < 0).tolist()
+
+    # flips a phase of every state with sum of weights over its (flipped) ones >= threshold, ancillas are uncomputed
+    def build_oracle(weights: Weights, flipped: list[bool], threshold: int) -> QuantumCircuit:
+        n = len(weights)
+        adder = WeightedAdder(n, weights)
+        comparator = IntegerComparator(adder.num_sum_qubits, threshold, geq=True)
+        sums = list(range(n, n + adder.num_sum_qubits))
+        compare = adder.num_qubits
+        oracle = QuantumCircuit(adder.num_qubits + 1 + comparator.num_ancillas)
+        flips = [i for i in range(n) if flipped[i]]
+        comparator_qubits = sums + [compare] + list(range(compare + 1, oracle.num_qubits))
+
+        if flips:
+            oracle.x(flips)
+        oracle.append(adder, range(adder.num_qubits))
+        oracle.append(comparator, comparator_qubits)
+        oracle.z(compare)
+        oracle.append(comparator.inverse(), comparator_qubits)
+        oracle.append(adder.inverse(), range(adder.num_qubits))
+        if flips:
+            oracle.x(flips)
+        return oracle
+
+    def build_circuit(weights: Weights, flipped: list[bool], threshold: int, iterations: int) -> QuantumCircuit:
+        n = len(weights)
+        oracle = GroverComputer.build_oracle(weights, flipped, threshold)
+        qc = QuantumCircuit(oracle.num_qubits, n)
+        qc.h(range(n))
+        if iterations > 0:
+            qc.compose(grover_operator(oracle, reflection_qubits=list(range(n))).power(iterations), inplace=True)
+        qc.measure(range(n), range(n))
         return qc
 
-    def maximize(self, formula: Sum) -> VarState:
-        qc = self.build_curcuit(formula)
-        from qiskit import transpile
-        from qiskit_aer import AerSimulator
- 
-        simulator = AerSimulator()
- 
-        circ = transpile(qc, backend=simulator)
-        job = simulator.run(circ)
-        result = [1 if x == '1' else 0 for x in list(sorted(job.result().get_counts())[0])]
-        names = Computer.extract_vars(formula)
-        return {names[i]: result[i] for i in range(len(names))}
-        
-
-    
\ No newline at end of file
+    # counts keys are little endian: the last character is the first variable
+    def bits(key: str) -> np.ndarray:
+        return np.array([int(x) for x in reversed(key)], dtype=np.int64)
+
+    # yields the circuit of every round, gets its counts back, returns the best state
+    def search(self, formula: Sum | Formula) -> Generator[QuantumCircuit, Counts, VarState]:
+        formula = Formula.compile(formula)
+        if not formula.is_linear():
+            raise ValueError("GroverComputer solves linear formulas only")
+        n = len(formula)
+        if n == 0:
+            return {}
+        weights, flipped = self.quantize(formula)
+        q, flip, exact = np.array(weights), np.array(flipped, dtype=np.int64), formula.weights.astype(np.float64)
+        score = lambda x: int(q @ (x ^ flip))
+        rng = np.random.default_rng(self.seed)
+        best, bound, spent = None, 1.0, 0.0
+
+        while spent < self.budget * math.sqrt(2 ** n):
+            threshold = 0 if best is None else score(best) + 1
+            if threshold > int(q.sum()):
+                break
+            iterations = 0 if best is None else int(rng.integers(0, math.ceil(bound)))
+            spent += iterations + 1
+            counts = yield self.transpiled(weights, flipped, threshold, iterations)
+
+            # distinct marked states, most frequent first, so ties on the exact weights go to the most frequent state
+            marked = [x for key in sorted(counts, key=counts.get, reverse=True) if score(x := GroverComputer.bits(key)) >= threshold]
+            if marked:
+                best, bound = max(marked, key=lambda x: exact @ x), 1.0
+            else:
+                bound = min(bound * self.growth, math.sqrt(2 ** n))
+
+        if best is None:
+            best = np.zeros(n, dtype=np.int64)
+        return {name: int(x) for name, x in zip(formula.names, best)}
+
+    def maximize(self, formula: Sum | Formula) -> VarState:
+        return self.maximize_many([formula])[0]
+
+    batched = True
+
+    # searches run side by side, the circuits of every round go to the simulator as one multi-experiment job
+    def maximize_many(self, formulas: list[Sum | Formula]) -> list[VarState]:
+        searches = [self.search(formula) for formula in formulas]
+        results: list[VarState] = [None] * len(formulas)
+        running: dict[int, QuantumCircuit] = {}
+        for i, search in enumerate(searches):
+            try:
+                running[i] = next(search)
+            except StopIteration as done:
+                results[i] = done.value
+        # a new simulator seed every round, so repeated circuits are not measured the same way
+        seed = self.seed
+        while running:
+            job = self.simulator.run(list(running.values()), shots=self.shots, seed_simulator=seed).result()
+            seed += 1
+            for j, i in enumerate(list(running)):
+                try:
+                    running[i] = searches[i].send(job.get_counts(j))
+                except StopIteration as done:
+                    results[i] = done.value
+                    del running[i]
+        return results
@@ -1,4 +1,5 @@
 from dataclasses import dataclass
+from typing import Optional
 
 from comp import *
 import itertools
@@ -9,21 +10,22 @@ from qiskit_optimization import QuadraticProgram
 LinearFormula = dict[str, int]
 
 class HamiltonianComputer(Computer):
-    def to_linear_formula(formula: Sum, acc: LinearFormula = {}) -> LinearFormula: 
-         while True:
-            match formula:
-                case Sum(Zero(), Mul(x, name)):
-                    return {name: x} | acc
-                case Sum(next, Mul(x, name)):
-                    formula = next
-                    acc = {name: x} | acc
-
-    def formulate_problem(formula: Sum) -> QuadraticProgram:
+    def to_linear_formula(formula: Sum | Formula) -> LinearFormula: 
+        formula = Formula.compile(formula)
+        return dict(zip(formula.names, formula.weights.tolist()))
+
+    def formulate_problem(formula: Sum | Formula) -> QuadraticProgram:
+        formula = Formula.compile(formula)
         qp = QuadraticProgram()
-        vars = Computer.extract_vars(formula)
-        for name in vars:
+        for name in formula.names:
             qp.binary_var(name)
-        qp.maximize(linear=HamiltonianComputer.to_linear_formula(formula))
+        quadratic: dict[tuple[str, str], float] = {}
+        for x, (i, j) in zip(formula.couplings.tolist(), formula.pairs.tolist()):
+            key = (formula.names[i], formula.names[j])
+            quadratic[key] = quadratic.get(key, 0) + x
+        qp.maximize(linear=HamiltonianComputer.to_linear_formula(formula), quadratic=quadratic)
+        if formula.budget is not None:
+            qp.linear_constraint(dict(zip(formula.names, formula.costs.tolist())), '<=', formula.budget, 'budget')
         # print(qp.export_as_lp_string())
         return qp
 
@@ -31,18 +33,23 @@ class HamiltonianComputer(Computer):
 # run optimization on qiskit's solver (classic and quantum)
 # https://qiskit-community.github.io/qiskit-finance/tutorials/01_portfolio_optimization.html
 
+from qiskit import QuantumCircuit
 from qiskit.circuit.library import n_local
 from qiskit.result import QuasiDistribution
 from qiskit_aer.primitives import Sampler
 from qiskit_algorithms import NumPyMinimumEigensolver, QAOA, SamplingVQE
 from qiskit_algorithms.optimizers import COBYLA
 from qiskit_optimization.algorithms import MinimumEigenOptimizer
-from qiskit_algorithms.utils import algorithm_globals
+from qiskit_algorithms.utils import algorithm_globals, validate_initial_point
+from qiskit.primitives import SamplerResult
+from concurrent.futures import ThreadPoolExecutor
+import threading
+from aerplan import SimulatorPlan, choose
 
 
 class HamiltonianComputerClassicEigen(HamiltonianComputer):
 
-    def maximize(self, formula: Sum) -> VarState:
+    def maximize(self, formula: Sum | Formula) -> VarState:
         qp = HamiltonianComputer.formulate_problem(formula)
         exact_mes = NumPyMinimumEigensolver()
         exact_eigensolver = MinimumEigenOptimizer(exact_mes)
@@ -50,19 +57,162 @@ class HamiltonianComputerClassicEigen(HamiltonianComputer):
         return result.variables_dict
 
 
+# lets the VQE runs of several chunks (one thread each) share a sampler: a round waits until every running chunk
+# asked for its next evaluation, then all of them go to Aer as a single multi-experiment job and the results are split back
+class LockstepSampler(Sampler):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.parties = 0
+        self.pending: list[dict] = []
+        self.condition = threading.Condition()
+        self.lock = threading.Lock()
+
+    def join(self, parties: int):
+        with self.condition:
+            self.parties += parties
+
+    def leave(self):
+        with self.condition:
+            self.parties -= 1
+            self.flush()
+
+    # registering circuits isn't thread safe in the base sampler
+    def _run(self, circuits, parameter_values, **run_options):
+        with self.lock:
+            return super()._run(circuits, parameter_values, **run_options)
+
+    def _call(self, circuits, parameter_values, **run_options) -> SamplerResult:
+        request = {'circuits': list(circuits), 'values': list(parameter_values), 'options': run_options, 'result': None}
+        with self.condition:
+            self.pending.append(request)
+            self.flush()
+            while request['result'] is None:
+                self.condition.wait()
+        if isinstance(request['result'], Exception):
+            raise request['result']
+        return request['result']
+
+    # called with the condition held
+    def flush(self):
+        if len(self.pending) == 0 or len(self.pending) < self.parties:
+            return
+        batch, self.pending = self.pending, []
+        try:
+            result = super()._call([i for r in batch for i in r['circuits']], [v for r in batch for v in r['values']], **batch[0]['options'])
+            start = 0
+            for r in batch:
+                end = start + len(r['circuits'])
+                r['result'] = SamplerResult(result.quasi_dists[start:end], result.metadata[start:end])
+                start = end
+        except Exception as e:
+            for r in batch:
+                r['result'] = e
+        self.condition.notify_all()
+
+
+# ansatz, optimizer and sampler are built once and reused for every chunk (the sampler keeps its transpiled circuits),
+# the ansatz is cached per qubit count, chunk coefficients only enter through the cost operator.
+# warm_start starts each chunk from the optimal angles of the previous chunk of the same width
+# the simulation method of every width is planned against memory_budget (available memory if None) before the first
+# run (see aerplan.choose): wide chunks are sampled with `shots`, then in single precision, then as a matrix product
+# state with a linear ansatz, and a MemoryError is raised before submitting when none of them fits
 class HamiltonianComputerQuantum(HamiltonianComputer):
-
-    def maximize(self, formula: Sum) -> VarState:
+    def __init__(self, warm_start: bool = True, maxiter: int = 500, seed: int = 1234, memory_budget: Optional[float] = None, shots: int = 1024):
+        self.warm_start = warm_start
+        self.maxiter = maxiter
+        self.seed = seed
+        self.memory_budget = memory_budget
+        self.shots = shots
+        self.reset()
+
+    batched = True
+
+    def reset(self):
+        self.samplers: dict[SimulatorPlan, Sampler] = {}
+        self.batch_sampler: Optional[LockstepSampler] = None
+        self.batch_plan: Optional[SimulatorPlan] = None
+        self.optimizer: Optional[COBYLA] = None
+        self.plans: dict[int, SimulatorPlan] = {}
+        self.ansatze: dict[int, QuantumCircuit] = {}
+        self.optimal_points: dict[int, np.ndarray] = {}
+
+    # caches hold qiskit objects, each process (see optimize_parallel) rebuilds its own
+    def __getstate__(self):
+        return {'warm_start': self.warm_start, 'maxiter': self.maxiter, 'seed': self.seed, 'memory_budget': self.memory_budget, 'shots': self.shots}
+
+    # kept per width, so a width always runs with the same method (and ansatz)
+    def plan(self, qubits: int) -> SimulatorPlan:
+        if qubits not in self.plans:
+            self.plans[qubits] = choose(qubits, self.memory_budget, self.shots)
+        return self.plans[qubits]
+
+    def sampler(self, plan: SimulatorPlan) -> Sampler:
+        if plan not in self.samplers:
+            self.samplers[plan] = Sampler(backend_options=plan.backend_options(), run_options=plan.run_options(self.seed))
+        return self.samplers[plan]
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.reset()
+
+    def ansatz(self, qubits: int) -> QuantumCircuit:
+        if qubits not in self.ansatze:
+            # a single qubit has nothing to entangle (two-qubit blocks fail with "block_size (2) cannot be larger than number of qubits (1)")
+            self.ansatze[qubits] = n_local(qubits, "ry", "cz" if qubits > 1 else [], reps=3, entanglement=self.plan(qubits).entanglement())
+        return self.ansatze[qubits]
+
+    def maximize(self, formula: Sum | Formula) -> VarState:
+        formula = Formula.compile(formula)
         qp = HamiltonianComputer.formulate_problem(formula)
 
-        algorithm_globals.random_seed = 1234
-        cobyla = COBYLA()
-        cobyla.set_options(maxiter=500)
-        ry = n_local(len(Computer.extract_vars(formula)), "ry", "cz", reps=3, entanglement="full")
-        svqe_mes = SamplingVQE(sampler=Sampler(), ansatz=ry, optimizer=cobyla)
+        algorithm_globals.random_seed = self.seed
+        if self.optimizer is None:
+            self.optimizer = COBYLA()
+            self.optimizer.set_options(maxiter=self.maxiter)
+        qubits = len(formula)
+        sampler = self.sampler(self.plan(qubits))
+        initial_point = self.optimal_points.get(qubits) if self.warm_start else None
+        svqe_mes = SamplingVQE(sampler=sampler, ansatz=self.ansatz(qubits), optimizer=self.optimizer, initial_point=initial_point)
         svqe = MinimumEigenOptimizer(svqe_mes)
-        result = svqe.solve(qp) 
-        return result.variables_dict    
-        
-
+        result = svqe.solve(qp)
+        if self.warm_start and result.min_eigen_solver_result is not None:
+            self.optimal_points[qubits] = result.min_eigen_solver_result.optimal_point
+        return result.variables_dict
 
+    # every chunk runs its own VQE in a thread, their circuit evaluations are submitted together (see LockstepSampler)
+    # initial points are drawn up front, as maximize would draw them, so the threads don't race on the global seed
+    # chunks planned for different simulation methods can't share a job, they are solved one by one
+    def maximize_many(self, formulas: list[Sum | Formula]) -> list[VarState]:
+        formulas = [Formula.compile(formula) for formula in formulas]
+        plans = {self.plan(len(formula)) for formula in formulas}
+        if len(formulas) < 2 or len(plans) > 1:
+            return [self.maximize(formula) for formula in formulas]
+        plan = plans.pop()
+        if self.batch_sampler is None or self.batch_plan != plan:
+            self.batch_sampler = LockstepSampler(backend_options={"max_parallel_experiments": 0} | plan.backend_options(), run_options=plan.run_options(self.seed))
+            self.batch_plan = plan
+
+        initial_points = []
+        for formula in formulas:
+            algorithm_globals.random_seed = self.seed
+            point = self.optimal_points.get(len(formula)) if self.warm_start else None
+            initial_points.append(validate_initial_point(point, self.ansatz(len(formula))))
+
+        def solve(i: int):
+            try:
+                optimizer = COBYLA()
+                optimizer.set_options(maxiter=self.maxiter)
+                ansatz = self.ansatz(len(formulas[i])).copy()
+                svqe_mes = SamplingVQE(sampler=self.batch_sampler, ansatz=ansatz, optimizer=optimizer, initial_point=initial_points[i])
+                return MinimumEigenOptimizer(svqe_mes).solve(HamiltonianComputer.formulate_problem(formulas[i]))
+            finally:
+                self.batch_sampler.leave()
+
+        self.batch_sampler.join(len(formulas))
+        with ThreadPoolExecutor(max_workers=len(formulas)) as pool:
+            results = list(pool.map(solve, range(len(formulas))))
+        if self.warm_start:
+            for formula, result in zip(formulas, results):
+                if result.min_eigen_solver_result is not None:
+                    self.optimal_points[len(formula)] = result.min_eigen_solver_result.optimal_point
+        return [result.variables_dict for result in results]
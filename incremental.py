@@ -0,0 +1,80 @@
+from dataclasses import dataclass, replace
+from typing import Iterable, Iterator
+import itertools
+
+from comp import *
+from portfolio import Asset, HoldingPosition, ActingPosition, Chunk, formulate, decide, split_chunks, ticker_of
+from instrument import span
+
+
+# decisions that changed since the previous solve (the same unit can be in both when only the kind of action changed)
+@dataclass
+class ActionDelta:
+    added: list[ActingPosition]
+    removed: list[ActingPosition]
+    chunks: int # chunks solved again
+
+ActionKey = tuple[str, bool, bool]
+
+def action_key(action: ActingPosition) -> ActionKey:
+    return (action.asset.name, action.simple, action.optimistic)
+
+# optimize_agg that keeps its chunks, their formulas and solved states: after an update only the chunks holding
+# changed units are formulated and solved again, so the cost follows the size of the change, not of the portfolio
+class IncrementalOptimizer:
+    def __init__(self, qbits: int, computer: Computer, portfolio: list[HoldingPosition], assets_of_interest: list[Asset], simple: bool = True):
+        self.computer = computer
+        self.simple = simple
+        positions = {x.asset.name: x.asset for x in portfolio}
+        self.held = {x.name for x in assets_of_interest if positions.get(x.name) == x}
+        self.chunks: list[list[Asset]] = [chunk for _, chunk in split_chunks(qbits, portfolio, assets_of_interest)]
+        self.location: dict[str, tuple[int, int]] = {x.name: (i, j) for i, chunk in enumerate(self.chunks) for j, x in enumerate(chunk)}
+        self.tickers: dict[str, set[int]] = {}
+        for i, chunk in enumerate(self.chunks):
+            for x in chunk:
+                self.tickers.setdefault(ticker_of(x), set()).add(i)
+        self.formulas: list[Formula] = [None] * len(self.chunks)
+        self.states: list[VarState] = [None] * len(self.chunks)
+        self.decisions: list[list[ActingPosition]] = [[] for _ in self.chunks]
+        self.solve(range(len(self.chunks)))
+
+    def chunk(self, i: int) -> Chunk:
+        return [HoldingPosition(x) for x in self.chunks[i] if x.name in self.held], self.chunks[i]
+
+    def solve(self, indices: Iterable[int]) -> ActionDelta:
+        indices = sorted(set(indices))
+        added, removed = [], []
+        with span('incremental.solve', chunks=len(indices)):
+            for start in range(0, len(indices), self.computer.batch_size):
+                batch = indices[start:start + self.computer.batch_size]
+                formulas = [formulate(*self.chunk(i), self.simple) for i in batch]
+                for i, formula, state in zip(batch, formulas, self.computer.maximize_many(formulas)):
+                    before, after = self.decisions[i], decide(self.chunks[i], state)
+                    old, new = set(map(action_key, before)), set(map(action_key, after))
+                    removed += [x for x in before if action_key(x) not in new]
+                    added += [x for x in after if action_key(x) not in old]
+                    self.formulas[i], self.states[i], self.decisions[i] = formula, state, after
+        return ActionDelta(added, removed, len(indices))
+
+    # all current decisions, in the order optimize_agg gives them
+    def actions(self) -> Iterator[ActingPosition]:
+        return itertools.chain.from_iterable(self.decisions)
+
+    # assets: new versions of units (matched by name), hold / release: names of units opened / closed since the last solve
+    def update(self, assets: Iterable[Asset] = (), hold: Iterable[str] = (), release: Iterable[str] = ()) -> ActionDelta:
+        affected = set()
+        for x in assets:
+            i, j = self.location[x.name]
+            self.chunks[i][j] = x
+            affected.add(i)
+        for name in hold:
+            self.held.add(name)
+            affected.add(self.location[name][0])
+        for name in release:
+            self.held.discard(name)
+            affected.add(self.location[name][0])
+        return self.solve(affected)
+
+    # every unit of the ticker gets the new price and swings
+    def reprice(self, ticker: str, **changes) -> ActionDelta:
+        return self.update([replace(x, **changes) for i in sorted(self.tickers.get(ticker, ())) for x in self.chunks[i] if ticker_of(x) == ticker])
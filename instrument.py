@@ -0,0 +1,78 @@
+from collections import defaultdict
+from contextlib import nullcontext
+import json
+import os
+import sys
+import threading
+import time
+
+
+# timed spans and counters around the hot path (prices, portfolio building, formulas, solver, report)
+# off by default (span() then returns a shared no-op context), switch on with enable() or FQC_TRACE=1
+# the entry points (cli.py, sweep.py, bench.py) call report() when they are done
+# note: spans of process pool workers (optimize_agg with workers > 1) stay in the workers
+
+enabled = os.environ.get('FQC_TRACE', '0') not in ('', '0')
+
+events: list[dict] = []
+counters: dict[str, int] = defaultdict(int)
+_origin = time.perf_counter()
+_noop = nullcontext()
+
+
+class Span:
+    def __init__(self, name: str, args: dict):
+        self.name = name
+        self.args = args
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        end = time.perf_counter()
+        events.append({'name': self.name, 'ph': 'X', 'ts': (self.start - _origin) * 1e6, 'dur': (end - self.start) * 1e6,
+                       'pid': os.getpid(), 'tid': threading.get_ident(), 'args': self.args})
+        return False
+
+
+def enable(on: bool = True):
+    global enabled
+    enabled = on
+
+def reset():
+    events.clear()
+    counters.clear()
+
+def span(name: str, **args):
+    return Span(name, args) if enabled else _noop
+
+def count(name: str, n: int = 1):
+    if enabled:
+        counters[name] += n
+
+
+# per span name: calls, total, mean and max time; counters below
+def summary() -> str:
+    totals: dict[str, list[float]] = defaultdict(list)
+    for e in events:
+        totals[e['name']].append(e['dur'] / 1e6)
+    row_format = '{:<24}  {:>8}  {:>10}  {:>10}  {:>10}'
+    lines = [row_format.format('Span', 'Calls', 'Total s', 'Mean ms', 'Max ms')]
+    for name, durations in sorted(totals.items(), key=lambda x: -sum(x[1])):
+        lines.append(row_format.format(name, len(durations), f'{sum(durations):.4f}', f'{1000 * sum(durations) / len(durations):.3f}', f'{1000 * max(durations):.3f}'))
+    if len(counters) > 0:
+        lines.append('')
+        lines += ['{:<24}  {:>8}'.format(name, value) for name, value in sorted(counters.items())]
+    return '\n'.join(lines)
+
+# chrome trace event format (chrome://tracing, perfetto)
+def dump_trace(path: str = 'trace.json'):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events, 'otherData': {'counters': dict(counters)}}, f)
+
+# summary to stderr (stdout stays the command's output) and the trace file, only when tracing is on
+def report(path: str = 'trace.json'):
+    if enabled:
+        print(summary(), file=sys.stderr)
+        dump_trace(path)
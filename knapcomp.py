@@ -0,0 +1,102 @@
+from comp import *
+
+
+# exact solver for linear formulas with a budget (Formula.costs, Formula.budget): chosen costs sum to at most the budget
+# a negative cost (selling a held unit) frees cash, so such a variable is flipped (x = 1 - z): its cost becomes |c|,
+# its weight -w and the budget grows by |c|, which leaves a 0/1 knapsack with non-negative costs
+# integer costs with n * budget up to max_cells go to the dynamic program, anything else to branch-and-bound
+# (depth first over groups of identical items, best ratio first, pruned by the fractional relaxation), both scale to
+# thousands of variables
+# without a budget every positive weight is taken
+class KnapsackComputer(Computer):
+    constrained = True
+
+    def __init__(self, max_cells: int = 1 << 25):
+        self.max_cells = max_cells
+
+    # best subset of items within capacity: pseudo-polynomial table over integer capacities
+    def dynamic(values: np.ndarray, costs: np.ndarray, capacity: int) -> np.ndarray:
+        best = np.zeros(capacity + 1)
+        taken = np.zeros((len(values), capacity + 1), dtype=bool)
+        for i, (v, k) in enumerate(zip(values.tolist(), costs.tolist())):
+            if k > capacity:
+                continue
+            candidate = best[:capacity + 1 - k] + v
+            taken[i, k:] = candidate > best[k:]
+            best[k:] = np.maximum(best[k:], candidate)
+        chosen = np.zeros(len(values), dtype=bool)
+        room = capacity
+        for i in range(len(values) - 1, -1, -1):
+            if taken[i, room]:
+                chosen[i] = True
+                room -= int(costs[i])
+        return chosen
+
+    # identical items (units of one ticker) are one group with a count, so ties between them are not branched on
+    def branch_and_bound(values: np.ndarray, costs: np.ndarray, capacity: float) -> np.ndarray:
+        items, group, counts = np.unique(np.column_stack((values, costs)), axis=0, return_inverse=True, return_counts=True)
+        group = group.reshape(-1)
+        order = np.argsort(-items[:, 0] / items[:, 1], kind='stable')
+        v, k, n = items[order, 0].tolist(), items[order, 1].tolist(), counts[order].tolist()
+        m = len(v)
+        value_sums = np.concatenate(([0.0], np.cumsum(items[order, 0] * counts[order])))
+        cost_sums = np.concatenate(([0.0], np.cumsum(items[order, 1] * counts[order])))
+
+        # groups from i on, taken whole while they fit and the next one in part
+        def bound(i: int, room: float, value: float) -> float:
+            r = int(np.searchsorted(cost_sums, cost_sums[i] + room, side='right')) - 1
+            fill = value + value_sums[r] - value_sums[i]
+            return fill + (room - (cost_sums[r] - cost_sums[i])) * v[r] / k[r] if r < m else fill
+
+        taken, best_taken = [0] * m, [0] * m
+        best, value, room, i = 0.0, 0.0, capacity, 0
+        while True:
+            # as many of every group as fit, while the relaxation can still beat the best
+            while i < m and bound(i, room, value) > best:
+                t = min(n[i], int(room // k[i]))
+                taken[i], value, room, i = t, value + t * v[i], room - t * k[i], i + 1
+            if i >= m and value > best:
+                best, best_taken = value, taken[:]
+            # one less of the last group taken from
+            j = min(i, m) - 1
+            while j >= 0 and taken[j] == 0:
+                j -= 1
+            if j < 0:
+                break
+            for x in range(j + 1, min(i, m)):
+                taken[x] = 0
+            taken[j], value, room, i = taken[j] - 1, value - v[j], room + k[j], j + 1
+
+        # first units of a group are the chosen ones
+        chosen = np.zeros(len(values), dtype=bool)
+        remaining = np.zeros(len(items), dtype=np.int64)
+        remaining[order] = best_taken
+        for x, g in enumerate(group.tolist()):
+            if remaining[g] > 0:
+                chosen[x], remaining[g] = True, remaining[g] - 1
+        return chosen
+
+    def maximize(self, formula: Sum | Formula) -> VarState:
+        formula = Formula.compile(formula)
+        if not formula.is_linear():
+            raise ValueError("KnapsackComputer solves linear formulas only")
+        w = formula.weights.astype(np.float64)
+        if formula.budget is None:
+            return {name: int(x) for name, x in zip(formula.names, w > 0)}
+
+        c = formula.costs.astype(np.float64) if len(formula.costs) > 0 else np.zeros(len(w))
+        flipped = c < 0
+        values, costs = np.where(flipped, -w, w), np.abs(c)
+        capacity = formula.budget + costs[flipped].sum()
+        if capacity < 0:
+            raise ValueError(f"no state within budget {formula.budget}")
+
+        # free items are taken when they pay, items that do not pay are never worth their cost
+        z = (costs == 0) & (values > 0)
+        items = np.flatnonzero((costs > 0) & (values > 0))
+        integral = np.all(costs[items] == np.round(costs[items]))
+        if integral and len(items) * (int(capacity) + 1) <= self.max_cells:
+            z[items] = KnapsackComputer.dynamic(values[items], costs[items].astype(np.int64), int(capacity))
+        elif len(items) > 0:
+            z[items] = KnapsackComputer.branch_and_bound(values[items], costs[items], float(capacity))
+        return {name: int(x) for name, x in zip(formula.names, z ^ flipped)}
@@ -0,0 +1,17 @@
+import os
+
+
+# memory the kernel can hand out without swapping: MemAvailable (free memory plus reclaimable page cache),
+# sysconf free pages (MemFree only) where /proc/meminfo is missing
+def available_memory() -> float:
+    try:
+        with open('/proc/meminfo', encoding='utf-8') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return float(line.split()[1]) * 1024
+    except OSError:
+        pass
+    try:
+        return float(os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE'))
+    except (ValueError, OSError, AttributeError):
+        return 16.0 * 2 ** 30
@@ -1,13 +1,20 @@
 
 
 from dataclasses import dataclass
-from functools import reduce
-from typing import Optional
+from functools import reduce, partial
+from typing import Optional, Iterator, Iterable, AsyncIterator
+from concurrent.futures import Executor, ProcessPoolExecutor
+from collections import deque
+import asyncio
 import itertools
+import multiprocessing
+import os
+import numpy as np
 
 from comp import *
+from instrument import span
 
-@dataclass
+@dataclass(slots=True)
 class Asset:
     name: str # ticker and (optionally) number
     price_t: int
@@ -16,14 +23,14 @@ class Asset:
     ticker: Optional[str] = None
 
 # open position at t
-@dataclass
+@dataclass(slots=True)
 class HoldingPosition:
     asset: Asset
 
 
 # t+1 price delta (poor-man's random walk)
 # can be estimated from volatility (or actual changes in price in case of pure optimizer's backtracking)
-@dataclass
+@dataclass(slots=True)
 class Prediction: 
     asset: Asset 
     up_price_t_plus_one: int
@@ -32,7 +39,7 @@ class Prediction:
 # future profit. 
 # if you open new position, value of portfolio will increase at t+1 = profit 
 # if you close existing position, you'll prevent loss in value at t+1 = profit
-@dataclass
+@dataclass(slots=True)
 class ProfitEstimator: 
     asset: Asset 
     profit_sum: int
@@ -42,7 +49,7 @@ class ProfitEstimator:
 
 # if asset is in portfolio (at t), action would close the position
 # otherwise - will open position
-@dataclass
+@dataclass(slots=True)
 class ActingPosition:
     asset: Asset
     simple: bool = True
@@ -60,6 +67,16 @@ def profit(prediction: Prediction, buy_sell: int, simple: bool) -> ProfitEstimat
         buy_sell * (prediction.up_price_t_plus_one - prediction.asset.price_t),
         buy_sell * (prediction.down_price_t_plus_one - prediction.asset.price_t))
 
+# predict and profit over arrays of prices and swings (one entry per unit), same values without an object per unit
+def predict_batch(price_t: np.ndarray, swing_up: np.ndarray, swing_down: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    price_t = np.asarray(price_t, dtype=np.float64)
+    return price_t + (price_t * swing_up / 100), price_t - (price_t * swing_down / 100)
+
+# profit_sum, profit_up, profit_down
+def profit_batch(price_t: np.ndarray, up_price_t_plus_one: np.ndarray, down_price_t_plus_one: np.ndarray, buy_sell: np.ndarray | int) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    up, down = up_price_t_plus_one - price_t, down_price_t_plus_one - price_t
+    return buy_sell * (up + down), buy_sell * up, buy_sell * down
+
 # a term of abstract (computer-agnostic) weighted sum. one term per asset (or unit of asset)
 def add_formula_chunk(acc: Sum, profit: ProfitEstimator) -> Sum:
     if profit.simple:
@@ -67,25 +84,349 @@ def add_formula_chunk(acc: Sum, profit: ProfitEstimator) -> Sum:
     else:
         return Sum(Sum(acc, Mul(profit.profit_sum, profit.asset.name + "_up")), Mul(profit.profit_sum, profit.asset.name + "_down"))
 
-def optimize(computer: Computer, portfolio: list[HoldingPosition], assets_of_interest: list[Asset], simple: bool = True) -> list[ActingPosition]:
-    holding = [x.asset for x in portfolio if x.asset in assets_of_interest]
-    candidates = [x for x in assets_of_interest if  not x in holding]
+# same terms as folding add_formula_chunk over profits, but built straight into the compiled form
+def compile_formula(profits: list[ProfitEstimator]) -> Formula:
+    names, weights = [], []
+    for profit in profits:
+        if profit.simple:
+            names.append(profit.asset.name)
+            weights.append(profit.profit_sum)
+        else:
+            names += [profit.asset.name + "_up", profit.asset.name + "_down"]
+            weights += [profit.profit_sum, profit.profit_sum]
+    return Formula(names, np.asarray(weights))
 
-    sell_profits = [profit(predict(x), -1, simple) for x in holding]
-    buy_profits = [profit(predict(x), 1, simple) for x in candidates]
-    profits = buy_profits + sell_profits
-    
-    formula = reduce(add_formula_chunk, profits, Zero())
-    result = [x[0] for x in computer.maximize(formula).items() if x[1] == 1]
+# units of a ticker with the same price, swings and holding status give identical terms, so one unit can stand for the rest
+UnitSignature = tuple[str, int, int, int, bool]
+
+def unit_signature(asset: Asset, held: bool) -> UnitSignature:
+    return (asset.ticker if asset.ticker is not None else asset.name, asset.price_t, asset.swing_up, asset.swing_down, held)
+
+def group_units(portfolio: list[HoldingPosition], assets_of_interest: list[Asset]) -> dict[UnitSignature, list[Asset]]:
+    held = {x.asset.name: x.asset for x in portfolio}
+    groups: dict[UnitSignature, list[Asset]] = {}
+    for x in assets_of_interest:
+        groups.setdefault(unit_signature(x, held.get(x.name) == x), []).append(x)
+    return groups
+
+# first unit of every group is solved, held ones keep their position
+def representatives(groups: dict[UnitSignature, list[Asset]]) -> tuple[list[HoldingPosition], list[Asset]]:
+    return [HoldingPosition(g[0]) for s, g in groups.items() if s[-1]], [g[0] for g in groups.values()]
+
+# copies decisions taken for representatives to all units of their group (same order as optimize would give)
+def expand_actions(actions: Iterable[ActingPosition], groups: dict[UnitSignature, list[Asset]], assets_of_interest: list[Asset]) -> list[ActingPosition]:
+    members = {g[0].name: g for g in groups.values()}
+    chosen: dict[str, set[tuple[bool, bool]]] = {}
+    for action in actions:
+        for x in members[action.asset.name]:
+            chosen.setdefault(x.name, set()).add((action.simple, action.optimistic))
+    return ([ActingPosition(x) for x in assets_of_interest if (True, False) in chosen.get(x.name, ())]
+            + [ActingPosition(x, False, False) for x in assets_of_interest if (False, False) in chosen.get(x.name, ())]
+            + [ActingPosition(x, False, True) for x in assets_of_interest if (False, True) in chosen.get(x.name, ())])
+
+# symmetric = True solves every group of identical units once (see group_units)
+# budget: cash the actions may spend, buying costs price_t and selling brings it back (needs a constrained computer,
+# e.g. KnapsackComputer); units of a group may then get different decisions, so symmetric is not applied
+def optimize(computer: Computer, portfolio: list[HoldingPosition], assets_of_interest: list[Asset], simple: bool = True, symmetric: bool = False,
+             budget: Optional[float] = None) -> list[ActingPosition]:
+    if budget is not None and not computer.constrained:
+        raise ValueError(f"{type(computer).__name__} does not take a budget")
+    if symmetric and budget is None:
+        groups = group_units(portfolio, assets_of_interest)
+        return expand_actions(optimize(computer, *representatives(groups), simple), groups, assets_of_interest)
+
+    formula = formulate(portfolio, assets_of_interest, simple, budget)
+    with span('maximize', engine=type(computer).__name__, vars=len(formula)):
+        state = computer.maximize(formula)
+    return decide(assets_of_interest, state)
+
+def formulate(portfolio: list[HoldingPosition], assets_of_interest: list[Asset], simple: bool = True, budget: Optional[float] = None) -> Formula:
+    with span('formulate', assets=len(assets_of_interest)):
+        # buy terms (candidates) first, then sell terms (holding, in portfolio order), as compile_formula would give them
+        index = {x.name: i for i, x in enumerate(assets_of_interest)}
+        holding = [i for x in portfolio if (i := index.get(x.asset.name)) is not None and assets_of_interest[i] == x.asset]
+        held = set(holding)
+        order = [i for i in range(len(assets_of_interest)) if i not in held] + holding
+        assets = [assets_of_interest[i] for i in order]
+
+        price_t = np.array([x.price_t for x in assets], dtype=np.float64)
+        up, down = predict_batch(price_t, np.array([x.swing_up for x in assets]), np.array([x.swing_down for x in assets]))
+        buy_sell = np.where(np.arange(len(assets)) < len(assets) - len(holding), 1, -1)
+        profit_sum, _, _ = profit_batch(price_t, up, down, buy_sell)
+
+        return Formula([x.name for x in assets], profit_sum, costs = buy_sell * price_t, budget = budget)
+
+def decide(assets_of_interest: list[Asset], state: VarState) -> list[ActingPosition]:
+    result = {x[0] for x in state.items() if x[1] == 1}
     
     return ([ActingPosition(x) for x in assets_of_interest if x.name in result] 
             + [ActingPosition(x, False, False) for x in assets_of_interest if x.name + "_down" in result]
             + [ActingPosition(x, False, True) for x in assets_of_interest if x.name + "_up" in result])
 
+# a chunk of assets paired with the positions held in it, enough to optimize it on its own
+Chunk = tuple[list[HoldingPosition], list[Asset]]
+
+def split_chunks(qbits: int, portfolio: list[HoldingPosition], assets_of_interest: list[Asset]) -> list[Chunk]:
+    return split_bounds([(x, x + qbits) for x in range(0, len(assets_of_interest), qbits)], portfolio, assets_of_interest)
+
+# chunks of the given [start, stop) ranges of assets_of_interest
+def split_bounds(bounds: list[tuple[int, int]], portfolio: list[HoldingPosition], assets_of_interest: list[Asset]) -> list[Chunk]:
+    held = {x.asset.name: x.asset for x in portfolio}
+    chunks = [assets_of_interest[start:stop] for start, stop in bounds]
+    return [([HoldingPosition(a) for a in chunk if held.get(a.name) == a], chunk) for chunk in chunks]
+
+# columnar portfolio: one row per ticker, its units are ticker#0 .. ticker#(units - 1) and the first `held` of them are open positions
+# Asset/HoldingPosition objects are only created on demand (per unit or per chunk), so memory follows tickers, not units
+@dataclass(eq=False)
+class AssetBlock:
+    tickers: list[str]
+    units: np.ndarray
+    held: np.ndarray
+    price_t: np.ndarray
+    swing_up: np.ndarray
+    swing_down: np.ndarray
+
+    def __post_init__(self):
+        self.offsets = np.concatenate(([0], np.cumsum(self.units, dtype=np.int64)))
+
+    def __len__(self) -> int:
+        return int(self.offsets[-1])
+
+    def unit(self, row: int, i: int) -> Asset:
+        return Asset(self.tickers[row] + "#" + str(i), self.price_t[row].item(), self.swing_up[row].item(), self.swing_down[row].item(), self.tickers[row])
+
+    def asset(self, index: int) -> Asset:
+        row = int(np.searchsorted(self.offsets, index, side="right")) - 1
+        return self.unit(row, index - int(self.offsets[row]))
+
+    # units in [start, stop) together with the ones held among them
+    def chunk(self, start: int, stop: int) -> Chunk:
+        assets, holding = [], []
+        row = int(np.searchsorted(self.offsets, start, side="right")) - 1
+        while start < stop:
+            end = min(stop, int(self.offsets[row + 1]))
+            for i in range(start - int(self.offsets[row]), end - int(self.offsets[row])):
+                x = self.unit(row, i)
+                assets.append(x)
+                if i < self.held[row]:
+                    holding.append(HoldingPosition(x))
+            start, row = end, row + 1
+        return holding, assets
+
+    def bounds(self, qbits: int) -> list[tuple[int, int]]:
+        return [(x, min(x + qbits, len(self))) for x in range(0, len(self), qbits)]
+
+    def chunks(self, qbits: int) -> Iterator[Chunk]:
+        return (self.chunk(start, stop) for start, stop in self.bounds(qbits))
+
+    def assets(self) -> Iterator[Asset]:
+        return (self.unit(row, i) for row in range(len(self.tickers)) for i in range(self.units[row]))
+
+    def positions(self) -> Iterator[HoldingPosition]:
+        return (HoldingPosition(self.unit(row, i)) for row in range(len(self.tickers)) for i in range(self.held[row]))
+
+# every pool worker unpickles the computer (and the block, if any) once at start and keeps it for all chunks it gets
+# workers are spawned rather than forked: forking a process that already ran Aer (OpenMP) deadlocks the children
+_worker_computer: Optional[Computer] = None
+_worker_block: Optional[AssetBlock] = None
+
+def _init_worker(computer: Computer, block: Optional[AssetBlock] = None):
+    global _worker_computer, _worker_block
+    _worker_computer = computer
+    _worker_block = block
+
+def _optimize_chunk(chunk: Chunk | tuple[int, int], simple: bool) -> list[ActingPosition]:
+    if _worker_block is not None:
+        chunk = _worker_block.chunk(*chunk)
+    return optimize(_worker_computer, chunk[0], chunk[1], simple)
+
+# in-process solving, chunks go to the computer batch_size at a time when it can batch them into one job
+def optimize_chunks(computer: Computer, chunks: Iterable[Chunk], simple: bool = True) -> Iterator[list[ActingPosition]]:
+    if not computer.batched:
+        return (optimize(computer, held, chunk, simple) for held, chunk in chunks)
+    def batches():
+        chunk_iter = iter(chunks)
+        while batch := list(itertools.islice(chunk_iter, computer.batch_size)):
+            formulas = [formulate(held, chunk, simple) for held, chunk in batch]
+            with span('maximize_many', engine=type(computer).__name__, chunks=len(formulas)):
+                states = computer.maximize_many(formulas)
+            yield from (decide(chunk, state) for (held, chunk), state in zip(batch, states))
+    return batches()
+
+def solve_chunks(computer: Computer, chunks: list[Chunk], simple: bool = True) -> list[list[ActingPosition]]:
+    return list(optimize_chunks(computer, chunks, simple))
+
+# optimize_agg for an event loop: chunks (batch_size of them for batched computers) are solved in executor, at most
+# `concurrency` at a time, and actions are yielded in chunk order as they become available
+# the default thread pool shares the computer between threads, so keep concurrency = 1 for computers with state (ham_q)
+# or pass a ProcessPoolExecutor
+async def optimize_agg_async(qbits: int, computer: Computer, portfolio: list[HoldingPosition], assets_of_interest: list[Asset], simple: bool = True,
+                             executor: Optional[Executor] = None, concurrency: int = 1) -> AsyncIterator[ActingPosition]:
+    loop = asyncio.get_running_loop()
+    chunks = split_chunks(qbits, portfolio, assets_of_interest)
+    size = computer.batch_size if computer.batched else 1
+    batches = iter([chunks[i:i + size] for i in range(0, len(chunks), size)])
+    pending = deque()
+    for batch in itertools.islice(batches, concurrency):
+        pending.append(loop.run_in_executor(executor, solve_chunks, computer, batch, simple))
+    while pending:
+        solved = await pending.popleft()
+        batch = next(batches, None)
+        if batch is not None:
+            pending.append(loop.run_in_executor(executor, solve_chunks, computer, batch, simple))
+        for actions in solved:
+            for action in actions:
+                yield action
+
+# chunks are either Chunk pairs or (start, stop) unit ranges of the block
+def optimize_parallel(workers: Optional[int], computer: Computer, chunks: list[Chunk] | list[tuple[int, int]], simple: bool = True, block: Optional[AssetBlock] = None) -> Iterator[list[ActingPosition]]:
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(computer, block)) as pool:
+        batch = max(1, len(chunks) // (4 * (workers or os.cpu_count() or 1)))
+        yield from pool.map(partial(_optimize_chunk, simple=simple), chunks, chunksize=batch)
+
 # since variables (asset prices) are independent (thus problem is linear), we just split assets in chunks and aggregate all actions
-def optimize_agg(qbits: int, computer: Computer, portfolio: list[HoldingPosition], assets_of_interest: list[Asset], simple: bool = True) -> list[ActingPosition]:
-   chunks = [assets_of_interest[x:x+qbits] for x in range(0, len(assets_of_interest), qbits)]
-   results = [optimize(computer, portfolio, chunk, simple) for chunk in chunks]
+# workers > 1 (or None for all cores) solves chunks in a process pool, results are streamed back in chunk order
+# symmetric = True chunks only one unit per group of identical units, so the number of chunks follows distinct tickers
+# a budget ties all units together: the whole portfolio is solved as one formula (see optimize)
+def optimize_agg(qbits: int, computer: Computer, portfolio: list[HoldingPosition], assets_of_interest: list[Asset], simple: bool = True, workers: Optional[int] = 1, symmetric: bool = False,
+                 budget: Optional[float] = None) -> Iterator[ActingPosition]:
+   if budget is not None:
+       return iter(optimize(computer, portfolio, assets_of_interest, simple, budget = budget))
+   if symmetric:
+       groups = group_units(portfolio, assets_of_interest)
+       actions = optimize_agg(qbits, computer, *representatives(groups), simple, workers)
+       return iter(expand_actions(actions, groups, assets_of_interest))
+   chunks = split_chunks(qbits, portfolio, assets_of_interest)
+   if workers == 1:
+       results = list(optimize_chunks(computer, chunks, simple))
+   else:
+       results = optimize_parallel(workers, computer, chunks, simple)
    return itertools.chain.from_iterable(results)
 
-    
+
+# optimize_agg over a columnar portfolio, chunks are materialized one at a time (in workers, when parallel)
+# with symmetric = True only two units per ticker are solved (a held and a free one), the decisions are copied lazily
+def optimize_block(qbits: int, computer: Computer, block: AssetBlock, simple: bool = True, workers: Optional[int] = 1, symmetric: bool = False) -> Iterator[ActingPosition]:
+    if symmetric:
+        rows = range(len(block.tickers))
+        reps = [(row, 0) for row in rows if block.held[row] > 0] + [(row, int(block.held[row])) for row in rows if block.held[row] < block.units[row]]
+        assets = [block.unit(row, i) for row, i in reps]
+        portfolio = [HoldingPosition(x) for (row, i), x in zip(reps, assets) if i < block.held[row]]
+        chosen: dict[tuple[int, bool], set[tuple[bool, bool]]] = {}
+        rep_keys = {x.name: (row, i < block.held[row]) for (row, i), x in zip(reps, assets)}
+        for action in optimize_agg(qbits, computer, portfolio, assets, simple, workers):
+            chosen.setdefault(rep_keys[action.asset.name], set()).add((action.simple, action.optimistic))
+        kinds = [(True, False), (False, False), (False, True)]
+        return (ActingPosition(block.unit(row, i), *kind) for kind in kinds for row in rows for i in range(block.units[row])
+                if kind in chosen.get((row, i < block.held[row]), ()))
+
+    if workers == 1:
+        results = optimize_chunks(computer, block.chunks(qbits), simple)
+    else:
+        results = optimize_parallel(workers, computer, block.bounds(qbits), simple, block)
+    return itertools.chain.from_iterable(results)
+
+
+# covariance of returns between tickers: nonzero entries only, both (a, b) and (b, a)
+Covariance = dict[tuple[str, str], float]
+
+def ticker_of(asset: Asset) -> str:
+    return asset.ticker if asset.ticker is not None else asset.name
+
+# tickers of one sector move together, different sectors are independent (block diagonal matrix, one block per sector)
+# volatility of a ticker is taken from its swings
+def sector_covariance(assets: list[Asset], sectors: dict[str, str], correlation: float = 0.5) -> Covariance:
+    volatility = {ticker_of(x): (x.swing_up + x.swing_down) / 200 for x in assets}
+    by_sector: dict[str, list[str]] = {}
+    for ticker in volatility:
+        by_sector.setdefault(sectors.get(ticker, ticker), []).append(ticker)
+    return {(a, b): volatility[a] * volatility[b] * (1.0 if a == b else correlation) for group in by_sector.values() for a in group for b in group}
+
+def covariance_from_matrix(tickers: list[str], matrix: np.ndarray, tolerance: float = 0.0) -> Covariance:
+    matrix = np.asarray(matrix)
+    rows, cols = np.nonzero(np.abs(matrix) > tolerance)
+    return {(tickers[i], tickers[j]): float(matrix[i, j]) for i, j in zip(rows.tolist(), cols.tolist())}
+
+# connected components of tickers linked by nonzero covariance (union-find), no quadratic term crosses two of them
+def ticker_blocks(tickers: Iterable[str], covariance: Covariance) -> list[list[str]]:
+    parent = {t: t for t in tickers}
+    def find(t: str) -> str:
+        while parent[t] != t:
+            parent[t] = parent[parent[t]]
+            t = parent[t]
+        return t
+    for a, b in covariance:
+        if a != b and a in parent and b in parent:
+            parent[find(a)] = find(b)
+    blocks: dict[str, list[str]] = {}
+    for t in parent:
+        blocks.setdefault(find(t), []).append(t)
+    return list(blocks.values())
+
+# mean-variance objective of a chunk: profit - risk_aversion * variance of the value held after acting
+# a unit is held after acting if it is held and not sold or free and bought: e = h + s * x (s = -1 held, 1 free),
+# variance = sum of cov(i, j) * p_i * p_j * e_i * e_j, units outside the chunk stay at their exposure (sum of p * e per ticker)
+def formulate_quadratic(held: set[str], chunk: list[Asset], covariance: Covariance, risk_aversion: float,
+                        exposure: dict[str, float], neighbors: dict[str, list[tuple[str, float]]]) -> Formula:
+    tickers = [ticker_of(x) for x in chunk]
+    h = np.array([x.name in held for x in chunk], dtype=np.float64)
+    s = 1 - 2 * h
+    p = np.array([x.price_t for x in chunk], dtype=np.float64)
+    profits = np.array([profit(predict(x), int(sign), True).profit_sum for x, sign in zip(chunk, s.tolist())], dtype=np.float64)
+
+    rest = dict((t, exposure.get(t, 0.0)) for t in tickers)
+    for t, value in zip(tickers, (p * h).tolist()):
+        rest[t] -= value
+    outside = np.array([sum(c * rest.get(u, exposure.get(u, 0.0)) for u, c in neighbors.get(t, [])) for t in tickers])
+    c = np.array([[covariance.get((a, b), 0.0) for b in tickers] for a in tickers]).reshape(len(chunk), len(chunk))
+    inside = c @ (p * h) - np.diag(c) * p * h
+
+    weights = profits - risk_aversion * (np.diag(c) * p * p * (1 + 2 * h * s) + 2 * s * p * (outside + inside))
+    q = -2 * risk_aversion * c * np.outer(p * s, p * s)
+    rows, cols = np.nonzero(np.triu(q, 1))
+    return Formula([x.name for x in chunk], weights, np.column_stack((rows, cols)).astype(np.int64), q[rows, cols])
+
+# quadratic counterpart of optimize_agg: tickers are split into independent blocks (ticker_blocks), blocks that fit into
+# qbits are packed together and solved in batches; a larger block is solved chunk by chunk, every chunk sees the units
+# decided before it at their new exposure (cross-chunk terms inside a block are kept, the result is a local optimum)
+def optimize_quadratic(qbits: int, computer: Computer, portfolio: list[HoldingPosition], assets_of_interest: list[Asset],
+                       covariance: Covariance, risk_aversion: float = 0.01) -> Iterator[ActingPosition]:
+    held = {x.asset.name for x in portfolio}
+    units: dict[str, list[Asset]] = {}
+    for x in assets_of_interest:
+        units.setdefault(ticker_of(x), []).append(x)
+    neighbors: dict[str, list[tuple[str, float]]] = {}
+    for (a, b), c in covariance.items():
+        neighbors.setdefault(a, []).append((b, c))
+    exposure = {t: float(sum(x.price_t for x in group if x.name in held)) for t, group in units.items()}
+
+    packed, large = [[]], []
+    for block in ticker_blocks(units, covariance):
+        members = [x for t in block for x in units[t]]
+        if len(members) > qbits:
+            large.append(members)
+        elif len(packed[-1]) + len(members) > qbits:
+            packed.append(members)
+        else:
+            packed[-1] += members
+
+    state: VarState = {}
+    def solve(chunks: list[list[Asset]]):
+        formulas = [formulate_quadratic(held, chunk, covariance, risk_aversion, exposure, neighbors) for chunk in chunks]
+        with span('maximize_many', engine=type(computer).__name__, chunks=len(formulas)):
+            states = computer.maximize_many(formulas)
+        for chunk, result in zip(chunks, states):
+            state.update(result)
+            for x in chunk:
+                exposure[ticker_of(x)] += x.price_t * (-1 if x.name in held else 1) * result[x.name]
+
+    packed = [x for x in packed if len(x) > 0]
+    for i in range(0, len(packed), computer.batch_size):
+        solve(packed[i:i + computer.batch_size])
+    for members in large:
+        count = -(-len(members) // qbits)
+        edges = [(i * len(members)) // count for i in range(count + 1)]
+        for start, stop in zip(edges, edges[1:]):
+            solve([members[start:stop]])
+    return iter(decide(assets_of_interest, state))
@@ -0,0 +1,60 @@
+from abc import ABC, abstractmethod
+from datetime import datetime
+import csv
+
+from pricestore import Quote
+
+
+History = dict[str, list[Quote]] # daily closes per ticker
+
+# anything that can give daily closes for a set of tickers over [start, end)
+class PriceProvider(ABC):
+
+    @abstractmethod
+    def history(self, tickers: list[str], start: datetime, end: datetime) -> History:
+        pass
+
+
+# yfinance, all tickers of a request go into a single download
+class YahooProvider(PriceProvider):
+
+    def history(self, tickers: list[str], start: datetime, end: datetime) -> History:
+        import yfinance as yf
+        import pandas as pd
+
+        data = yf.download(tickers, start=start, end=end, interval='1d', group_by='ticker', progress=False)
+        result = {}
+        for ticker in tickers:
+            if data is None or data.empty:
+                closes = []
+            elif isinstance(data.columns, pd.MultiIndex):
+                closes = data[ticker]['Close'].dropna().items() if ticker in data.columns.get_level_values(0) else []
+            else:
+                closes = data['Close'].dropna().items()
+            result[ticker] = [(datetime(t.year, t.month, t.day), int(p)) for t, p in closes]
+        return result
+
+
+# reads closes from a csv file (ticker,date,close with %Y-%m-%d dates), for reproducible runs without network
+class OfflineProvider(PriceProvider):
+    def __init__(self, path: str):
+        self.path = path
+        self.quotes: History = {}
+        self.requests = 0
+        with open(path, newline='') as f:
+            for row in csv.DictReader(f):
+                self.quotes.setdefault(row['ticker'], []).append((datetime.strptime(row['date'], '%Y-%m-%d'), int(float(row['close']))))
+        for quotes in self.quotes.values():
+            quotes.sort()
+
+    def history(self, tickers: list[str], start: datetime, end: datetime) -> History:
+        self.requests += 1
+        return {t: [(d, p) for d, p in self.quotes.get(t, []) if start <= d < end] for t in tickers}
+
+    def write(path: str, history: History):
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['ticker', 'date', 'close'])
+            for ticker, quotes in history.items():
+                for d, p in quotes:
+                    writer.writerow([ticker, d.strftime('%Y-%m-%d'), p])
@@ -0,0 +1,75 @@
+import sqlite3
+import threading
+from datetime import datetime, timedelta
+from typing import Optional
+
+
+Quote = tuple[datetime, int]
+
+day_format = '%Y-%m-%d'
+
+def day(date: datetime) -> str:
+    return date.strftime(day_format)
+
+
+# local price store (sqlite), replaces rewriting the whole json cache on every run
+# quotes are keyed by (ticker, trading date), windows record which [start, end) date ranges were fetched completely,
+# so "first close at or after a date" can be answered from the store only where nothing can be missing
+class PriceStore:
+    def __init__(self, path: str = 'price_cache.db', horizon: timedelta = timedelta(days=40)):
+        self.path = path
+        self.horizon = horizon
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.connection:
+            self.connection.execute('CREATE TABLE IF NOT EXISTS quotes (ticker TEXT, date TEXT, price INTEGER, PRIMARY KEY (ticker, date)) WITHOUT ROWID')
+            self.connection.execute('CREATE TABLE IF NOT EXISTS windows (ticker TEXT, start TEXT, end TEXT, PRIMARY KEY (ticker, start, end)) WITHOUT ROWID')
+
+    def is_empty(self) -> bool:
+        with self.lock:
+            return self.connection.execute('SELECT 1 FROM windows LIMIT 1').fetchone() is None
+
+    # end of the fetched range that covers date (None if it was never fetched)
+    def covered_until(self, date: datetime, ticker: str) -> Optional[datetime]:
+        with self.lock:
+            (end,) = self.connection.execute('SELECT MAX(end) FROM windows WHERE ticker = ? AND start <= ? AND end > ?',
+                                             (ticker, day(date), day(date))).fetchone()
+        return None if end is None else datetime.strptime(end, day_format)
+
+    def quotes(self, ticker: str, start: datetime, end: datetime) -> list[Quote]:
+        with self.lock:
+            rows = self.connection.execute('SELECT date, price FROM quotes WHERE ticker = ? AND date >= ? AND date < ? ORDER BY date',
+                                           (ticker, day(start), day(end))).fetchall()
+        return [(datetime.strptime(d, day_format), p) for d, p in rows]
+
+    # (found, price): price is None if the whole horizon after date was fetched and had no quotes
+    def lookup(self, date: datetime, ticker: str) -> tuple[bool, Optional[int]]:
+        end = self.covered_until(date, ticker)
+        if end is None:
+            return False, None
+        with self.lock:
+            row = self.connection.execute('SELECT price FROM quotes WHERE ticker = ? AND date >= ? AND date < ? ORDER BY date LIMIT 1',
+                                          (ticker, day(date), day(min(end, date + self.horizon)))).fetchone()
+        if row is not None:
+            return True, row[0]
+        return (True, None) if end >= date + self.horizon else (False, None)
+
+    # append-only: records the fetched range and all quotes found in it
+    def append(self, ticker: str, start: datetime, end: datetime, quotes: list[Quote]):
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT OR IGNORE INTO quotes VALUES (?, ?, ?)', [(ticker, day(d), p) for d, p in quotes])
+            self.connection.execute('INSERT OR IGNORE INTO windows VALUES (?, ?, ?)', (ticker, day(start), day(end)))
+
+    # one-time import of the old json cache: a cached price is the first close from its date on, None means nothing in the horizon
+    def import_cache(self, cache: dict[tuple[datetime, str], Optional[int]]):
+        with self.lock, self.connection:
+            for (date, ticker), price in cache.items():
+                if price is None:
+                    self.connection.execute('INSERT OR IGNORE INTO windows VALUES (?, ?, ?)', (ticker, day(date), day(date + self.horizon)))
+                else:
+                    self.connection.execute('INSERT OR IGNORE INTO quotes VALUES (?, ?, ?)', (ticker, day(date), price))
+                    self.connection.execute('INSERT OR IGNORE INTO windows VALUES (?, ?, ?)', (ticker, day(date), day(date + timedelta(days=1))))
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
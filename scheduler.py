@@ -0,0 +1,155 @@
+from dataclasses import dataclass, field, replace
+from typing import Optional, Iterator, Iterable
+import itertools
+import math
+import time
+import numpy as np
+
+from comp import *
+from memory import available_memory
+from portfolio import Asset, HoldingPosition, ActingPosition, split_bounds, optimize_chunks, optimize_parallel
+
+
+# chunk widths from a cost model instead of one fixed qbits for every engine
+# an engine solves a chunk of width w in about overhead + scale * base^w seconds and keeps about state_bytes * 2^w bytes
+# (statevector), the width with the least time per unit that fits the memory budget is used, and chunks are balanced
+# (sizes differ by at most one) so there is no short tail chunk
+@dataclass
+class CostModel:
+    overhead: float
+    scale: float
+    base: float = 2.0
+    state_bytes: float = 0.0
+    min_width: int = 1
+    max_width: int = 32
+
+    def seconds(self, width: int) -> float:
+        return self.overhead + self.scale * self.base ** width
+
+    def memory(self, width: int) -> float:
+        return self.state_bytes * 2.0 ** width if self.state_bytes > 0 else 0.0
+
+    def best_width(self, memory_budget: Optional[float] = None) -> int:
+        widths = [w for w in range(self.min_width, self.max_width + 1) if memory_budget is None or self.memory(w) <= memory_budget]
+        return min(widths or [self.min_width], key=lambda w: self.seconds(w) / w)
+
+# rough figures for a single core, calibrate() replaces them with measured ones
+priors: dict[str, CostModel] = {
+    "cla": CostModel(1e-4, 7.5e-6, state_bytes=1000, max_width=20), # every state is materialized as a tuple, a dict and a score
+    "cla_vec": CostModel(1e-4, 1e-8, max_width=40),
+    "ham_c": CostModel(1e-2, 3.5e-6, state_bytes=32, max_width=24),
+    "ham_q": CostModel(0.3, 0.4, 1.4, state_bytes=16, min_width=2, max_width=24), # a 1-qubit chunk is a whole VQE run for one unit
+    "grover": CostModel(0.05, 2e-4, 4.3, max_width=10), # adder and comparator qubits roughly double the width
+    # about linear in the width: time per unit only falls, so chunks are as wide as max_width
+    "knap": CostModel(5e-5, 0, 1.0, max_width=4096),
+    "anneal": CostModel(0.025, 0, 1.0, max_width=2048),
+}
+
+# least squares fit of overhead and scale (relative error, over a grid of bases) to measured (width, seconds)
+def fit(widths: list[int], seconds: list[float], prior: CostModel) -> CostModel:
+    w, t = np.asarray(widths, dtype=np.float64), np.asarray(seconds, dtype=np.float64)
+    best = None
+    for base in np.linspace(1.05, 4.0, 60):
+        a = np.column_stack([np.ones_like(w), base ** w]) / t[:, None]
+        coef = np.clip(np.linalg.lstsq(a, np.ones_like(t), rcond=None)[0], 0, None)
+        error = float(np.sum((a @ coef - 1) ** 2))
+        if best is None or error < best[0]:
+            best = (error, float(base), coef)
+    _, base, coef = best
+    return replace(prior, overhead=float(coef[0]), scale=float(coef[1]), base=base)
+
+# times maximize on random formulas of the given widths
+def calibrate(computer: Computer, widths: Iterable[int], prior: CostModel, repeats: int = 3, seed: int = 0) -> CostModel:
+    rng = np.random.default_rng(seed)
+    measured, seconds = [], []
+    for width in widths:
+        for _ in range(repeats):
+            formula = Formula(['x' + str(i) for i in range(width)], rng.uniform(-100, 100, width))
+            start = time.perf_counter()
+            computer.maximize(formula)
+            seconds.append(time.perf_counter() - start)
+            measured.append(width)
+    return fit(measured, seconds, prior)
+
+# ceil(n / width) ranges covering [start, start + n) with sizes differing by at most one
+def balanced_bounds(n: int, width: int, start: int = 0) -> list[tuple[int, int]]:
+    if n <= 0:
+        return []
+    count = math.ceil(n / width)
+    edges = start + (np.arange(count + 1) * n) // count
+    return list(zip(edges[:-1].tolist(), edges[1:].tolist()))
+
+def merge_bounds(bounds: list[tuple[int, int]]) -> list[tuple[int, int]]:
+    merged = []
+    for start, stop in bounds:
+        if merged and merged[-1][1] == start:
+            merged[-1] = (merged[-1][0], stop)
+        else:
+            merged.append((start, stop))
+    return merged
+
+
+Assignment = tuple[str, int, int] # engine, [start, stop) of assets_of_interest
+
+# engines are in order of preference, the last one takes whatever the time budget leaves
+# without a time budget everything goes to the first engine; with one, every preferred engine gets an evenly spread
+# sample of its chunks, as many as the budget left after solving all units on the last engine allows
+@dataclass
+class Scheduler:
+    engines: dict[str, Computer]
+    models: dict[str, CostModel] = field(default_factory=dict)
+    memory_budget: Optional[float] = None
+    time_budget: Optional[float] = None
+
+    def model(self, name: str) -> CostModel:
+        if name in self.models:
+            return self.models[name]
+        if name not in priors:
+            raise ValueError(f"no cost model for engine {name!r}, pass one in models (calibrate() starts from it)")
+        return priors[name]
+
+    def width(self, name: str) -> int:
+        return self.model(name).best_width(self.memory_budget if self.memory_budget is not None else available_memory())
+
+    def calibrate(self, widths: Iterable[int] = range(1, 9), repeats: int = 3):
+        widths = list(widths)
+        for name, computer in self.engines.items():
+            model = self.model(name)
+            self.models[name] = calibrate(computer, [w for w in widths if model.min_width <= w <= model.max_width], model, repeats)
+
+    def plan(self, n: int) -> list[Assignment]:
+        names = list(self.engines)
+        fallback = names[-1] if self.time_budget is not None else names[0]
+        free = [(0, n)] if n > 0 else []
+        plan: list[Assignment] = []
+        if self.time_budget is not None:
+            fallback_width = self.width(fallback)
+            per_unit = self.model(fallback).seconds(fallback_width) / fallback_width
+            remaining = self.time_budget - per_unit * n
+            for name in names[:-1]:
+                width = self.width(name)
+                candidates = [x for start, stop in free for x in balanced_bounds(stop - start, width, start)]
+                extra = self.model(name).seconds(width) - per_unit * width
+                count = len(candidates) if extra <= 0 else min(len(candidates), int(max(remaining, 0) // extra))
+                chosen = {candidates[i] for i in np.linspace(0, len(candidates) - 1, count).round().astype(int).tolist()} if count > 0 else set()
+                remaining -= extra * len(chosen)
+                plan += [(name, start, stop) for start, stop in chosen]
+                free = merge_bounds([x for x in candidates if x not in chosen])
+        plan += [(fallback, x, y) for start, stop in free for x, y in balanced_bounds(stop - start, self.width(fallback), start)]
+        return sorted(plan, key=lambda x: x[1])
+
+    def estimate(self, plan: list[Assignment]) -> float:
+        return sum(self.model(name).seconds(stop - start) for name, start, stop in plan)
+
+    # same actions as optimize_agg, every engine solves (and batches) its own chunks
+    def optimize(self, portfolio: list[HoldingPosition], assets_of_interest: list[Asset], simple: bool = True, workers: Optional[int] = 1) -> Iterator[ActingPosition]:
+        plan = self.plan(len(assets_of_interest))
+        results: dict[int, list[ActingPosition]] = {}
+        for name, computer in self.engines.items():
+            bounds = [(start, stop) for engine, start, stop in plan if engine == name]
+            if len(bounds) == 0:
+                continue
+            chunks = split_bounds(bounds, portfolio, assets_of_interest)
+            solved = optimize_chunks(computer, chunks, simple) if workers == 1 else optimize_parallel(workers, computer, chunks, simple)
+            results.update(zip((start for start, _ in bounds), solved))
+        return itertools.chain.from_iterable(results[start] for _, start, _ in plan)
@@ -0,0 +1,128 @@
+import argparse
+import csv
+import itertools
+import multiprocessing
+import time
+import warnings
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import asdict, replace
+from datetime import datetime, timedelta
+from typing import Optional
+
+import backtest
+import instrument
+import testutil
+from engines import engine
+from testutil import BacktestConfig, Market, load, prefetch_prices, read_tickers
+
+
+# backtests over a grid of config values and rolling (t0, t1) windows, in parallel, into one comparative table
+# python3 sweep.py --axis computer=cla,cla_vec --axis qbits=2,3 --start 2021-01-01 --stop 2022-08-01 --step 90 --length 180 --workers 4
+# prices of every date are prefetched once into the store all runs read, markets are read once per market settings
+# and reused by every run that differs only in solver settings (computer, qbits)
+
+market_fields = ['limit', 'point_to_unit', 't0y', 't0m', 't0d', 't1y', 't1m', 't1d', 'risk_lev', 'risk_spre']
+
+def window(t0: datetime, t1: datetime) -> dict[str, int]:
+    return {'t0y': t0.year, 't0m': t0.month, 't0d': t0.day, 't1y': t1.year, 't1m': t1.month, 't1d': t1.day}
+
+# windows of the given length, starting every step from start, ending no later than stop
+def rolling(start: datetime, stop: datetime, step: timedelta, length: timedelta) -> list[dict[str, int]]:
+    starts = (start + i * step for i in itertools.count())
+    return [window(t0, t0 + length) for t0 in itertools.takewhile(lambda t: t + length <= stop, starts)]
+
+# every combination of the windows and axis values, applied over base
+def grid(base: BacktestConfig, windows: Optional[list[dict[str, int]]] = None, **axes: list) -> list[BacktestConfig]:
+    return [replace(base, **w, **dict(zip(axes.keys(), values))) for w in (windows or [{}]) for values in itertools.product(*axes.values())]
+
+def market_key(cfg: BacktestConfig) -> tuple:
+    return tuple(getattr(cfg, x) for x in market_fields)
+
+def read_markets(configs: list[BacktestConfig], path: str = 'example_portfolio.csv') -> dict[tuple, Market]:
+    markets = {}
+    for cfg in configs:
+        if market_key(cfg) not in markets:
+            markets[market_key(cfg)] = backtest.read_market(cfg, path)
+    return markets
+
+
+# every pool worker gets the markets (and the store they were read from) once at start
+_worker_markets: dict[tuple, Market] = {}
+
+def _init_worker(markets: dict[tuple, Market], store_path: str):
+    global _worker_markets
+    _worker_markets = markets
+    testutil.price_store_path = store_path
+
+Row = dict[str, object]
+
+# warnings are silenced for the run only, with one worker it runs in the caller's process
+def _run(cfg: BacktestConfig) -> Row:
+    start = time.perf_counter()
+    with warnings.catch_warnings():
+        warnings.filterwarnings("ignore")
+        result = backtest.run(cfg, engine(cfg.computer), market = _worker_markets[market_key(cfg)])
+    gain = result.future_value_with_action - result.future_value_without_action
+    return asdict(cfg) | {'actions': len(result.actions), 'fv_no_action': result.future_value_without_action, 'fv_action': result.future_value_with_action,
+                          'gain': gain, 'gain_pct': 100 * gain / result.future_value_without_action if result.future_value_without_action != 0 else 0.0,
+                          'seconds': time.perf_counter() - start}
+
+# rows come back in the order of configs
+def sweep(configs: list[BacktestConfig], workers: int = 1, path: str = 'example_portfolio.csv') -> list[Row]:
+    prefetch_prices(read_tickers(path), [d for cfg in configs for d in backtest.dates(cfg)])
+    markets = read_markets(configs, path)
+    if workers <= 1:
+        _init_worker(markets, testutil.price_store_path)
+        return [_run(cfg) for cfg in configs]
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(markets, testutil.price_store_path)) as pool:
+        return list(pool.map(_run, configs))
+
+
+columns = ['t0', 't1', 'computer', 'qbits', 'limit', 'point_to_unit', 'risk_lev', 'risk_spre', 'actions', 'fv_no_action', 'fv_action', 'gain_pct', 'seconds']
+
+def table_rows(rows: list[Row]) -> list[list[object]]:
+    dated = [x | {'t0': f"{x['t0y']}-{x['t0m']:02}-{x['t0d']:02}", 't1': f"{x['t1y']}-{x['t1m']:02}-{x['t1d']:02}"} for x in rows]
+    return [[x[c] for c in columns] for x in sorted(dated, key=lambda x: -x['gain_pct'])]
+
+# best gain first
+def table(rows: list[Row]) -> str:
+    row_format = '{:<10}  {:<10}  {:<8}  {:>5}  {:>6}  {:>13}  {:>8}  {:>9}  {:>7}  {:>14}  {:>14}  {:>8}  {:>8}'
+    lines = [row_format.format(*columns)]
+    for row in table_rows(rows):
+        lines.append(row_format.format(*row[:9], f'{row[9]:.0f}', f'{row[10]:.0f}', f'{row[11]:.2f}', f'{row[12]:.3f}'))
+    return '\n'.join(lines)
+
+def dump_table(rows: list[Row], path: str = 'sweep_report.csv'):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(columns)
+        writer.writerows(table_rows(rows))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="runs backtests over a grid of settings and rolling windows")
+    parser.add_argument("--config", default="backtest_config", help="base config (json, without extension)")
+    parser.add_argument("--axis", action="append", default=[], help="field=value1,value2,...")
+    parser.add_argument("--start", type=datetime.fromisoformat, help="first window start, with --stop")
+    parser.add_argument("--stop", type=datetime.fromisoformat, help="last window end, with --start")
+    parser.add_argument("--step", type=int, default=30, help="days between window starts")
+    parser.add_argument("--length", type=int, default=180, help="window length in days")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--portfolio", default="example_portfolio.csv")
+    parser.add_argument("--output", default="sweep_report.csv")
+    args = parser.parse_args()
+    if (args.start is None) != (args.stop is None):
+        parser.error("--start and --stop go together")
+
+    base = BacktestConfig(**load(args.config))
+    axes = {}
+    for axis in args.axis:
+        field, values = axis.split("=")
+        axes[field] = [type(getattr(base, field))(x) for x in values.split(",")]
+    windows = rolling(args.start, args.stop, timedelta(days=args.step), timedelta(days=args.length)) if args.start is not None else None
+
+    rows = sweep(grid(base, windows, **axes), args.workers, args.portfolio)
+    dump_table(rows, args.output)
+    print(table(rows))
+    instrument.report()
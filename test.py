@@ -1,13 +1,22 @@
 import unittest
 import warnings
+import contextlib
+import io
+import tempfile
+import pickle
+import os
+
+import backtest
 
 from clacomp import *
+from cachecomp import *
 from portfolio import *
-from hamicomp import *
 from testutil import *
-from datetime import datetime
+from incremental import *
+from engines import engine
+from datetime import datetime, timedelta
 from typing import Callable
-from dataclasses import make_dataclass, asdict
+from dataclasses import make_dataclass, asdict, replace
 
 appl = Asset("APPL", 100)
 btc = Asset("BTC", 200)
@@ -26,7 +35,613 @@ class Testing(unittest.TestCase):
         expected_decisions = [ActingPosition(math)]
         self.assertEqual(decisions, expected_decisions)
 
+    def test_classic_vectorized(self):
+        computer = VectorizedClassicComputer(block_bits = 2)
+        portfolio = [HoldingPosition(appl), HoldingPosition(btc)]
+        candidates = [appl, btc, math]
+        decisions = optimize(computer, portfolio, candidates)
+        expected_decisions = [ActingPosition(math)]
+        self.assertEqual(decisions, expected_decisions)
+
+        formula = Sum(Sum(Sum(Sum(Sum(Zero(), Mul(3, "a")), Mul(-2, "b")), Mul(0, "c")), Mul(5, "d")), Mul(-1, "e"))
+        self.assertEqual(computer.maximize(formula), ClassicComputer().maximize(formula))
+
+    def test_compiled_formula(self):
+        from hamicomp import HamiltonianComputer
+        formula = Sum(Sum(Sum(Zero(), Mul(3, "a")), Mul(-2, "b")), Mul(4, "c"))
+        compiled = Formula.compile(formula)
+        self.assertEqual(compiled.names, ["a", "b", "c"])
+        self.assertEqual(compiled.weights.tolist(), [3, -2, 4])
+        self.assertIs(Formula.compile(compiled), compiled)
+        empty = Formula.compile(reduce(add_formula_chunk, [], Zero()))
+        self.assertEqual((empty.names, len(empty.weights), empty.is_linear()), ([], 0, True))
+        self.assertEqual(Computer.extract_vars(formula), ["a", "b", "c"])
+        self.assertEqual(HamiltonianComputer.to_linear_formula(formula), {"a": 3, "b": -2, "c": 4})
+
+        profits = [profit(predict(x), 1, True) for x in [appl, btc, math]]
+        folded = Formula.compile(reduce(add_formula_chunk, profits, Zero()))
+        direct = compile_formula(profits)
+        self.assertEqual(direct.names, folded.names)
+        self.assertEqual(direct.weights.tolist(), folded.weights.tolist())
+
+    def test_batch_formula(self):
+        assets = market1.assets_of_interest
+        price_t = np.array([x.price_t for x in assets])
+        up, down = predict_batch(price_t, np.array([x.swing_up for x in assets]), np.array([x.swing_down for x in assets]))
+        profit_sum, profit_up, profit_down = profit_batch(price_t, up, down, -1)
+        for i, x in enumerate(assets):
+            prediction = predict(x)
+            self.assertEqual((up[i], down[i]), (prediction.up_price_t_plus_one, prediction.down_price_t_plus_one))
+            estimate = profit(prediction, -1, True)
+            self.assertEqual((profit_sum[i], profit_up[i], profit_down[i]), (estimate.profit_sum, estimate.profit_up, estimate.profit_down))
+
+        holding = [x.asset for x in reversed(market1.positions)]
+        profits = [profit(predict(x), 1, True) for x in assets if x not in holding] + [profit(predict(x), -1, True) for x in holding]
+        expected = compile_formula(profits)
+        formula = formulate([HoldingPosition(x) for x in holding], assets)
+        self.assertEqual(formula.names, expected.names)
+        self.assertEqual(formula.weights.tolist(), expected.weights.tolist())
+
+        self.assertFalse(hasattr(appl, '__dict__'))
+        self.assertEqual(pickle.loads(pickle.dumps(ActingPosition(appl, False, True))), ActingPosition(appl, False, True))
+
+    def test_quadratic(self):
+        from hamicomp import HamiltonianComputerClassicEigen
+        formula = Formula.compile(Sum(Sum(Sum(Zero(), Mul(3, "a")), Mul(-2, "b")), Quad(5, "a", "c")))
+        self.assertEqual((formula.names, formula.weights.tolist(), formula.pairs.tolist(), formula.couplings.tolist()), (["a", "b", "c"], [3, -2, 0], [[0, 2]], [5]))
+        self.assertEqual(ClassicComputer().maximize(formula), {"a": 1, "b": 0, "c": 1})
+        rng = np.random.default_rng(3)
+        formula = Formula(["x" + str(i) for i in range(7)], rng.integers(-20, 20, 7), np.array([[0, 3], [5, 1], [2, 6], [4, 6], [0, 1]]), rng.integers(-30, 30, 5))
+        best = ClassicComputer.calculate(formula, ClassicComputer().maximize(formula))
+        for computer in [VectorizedClassicComputer(block_bits = 3), HamiltonianComputerClassicEigen()]:
+            self.assertEqual(ClassicComputer.calculate(formula, {k: int(v) for k, v in computer.maximize(formula).items()}), best)
+        cached = CachingComputer(ClassicComputer())
+        cached.maximize(formula)
+        cached.maximize(Formula(formula.names, formula.weights, formula.pairs[::-1], formula.couplings))
+        self.assertEqual(cached.stats()["misses"], 2)
+
+        sectors = read_sectors()
+        market = read_portfolio(limit = None, point_to_unit = 1)
+        covariance = sector_covariance(market.assets_of_interest, sectors)
+        self.assertEqual(len(ticker_blocks({ticker_of(x) for x in market.assets_of_interest}, covariance)), len({sectors[ticker_of(x)] for x in market.assets_of_interest}))
+
+        assets = [Asset(t + "#" + str(i), 50 + 17 * i + 31 * j, 4 + 3 * j, 2 + i, t) for j, t in enumerate("ABC") for i in range(2)]
+        portfolio = [HoldingPosition(assets[i]) for i in [0, 2, 5]]
+        covariance = sector_covariance(assets, {"A": "x", "B": "x", "C": "y"})
+        held = {x.asset.name for x in portfolio}
+        exposure = {t: float(sum(x.price_t for x in assets if x.ticker == t and x.name in held)) for t in "ABC"}
+        neighbors = {}
+        for (a, b), c in covariance.items():
+            neighbors.setdefault(a, []).append((b, c))
+        for risk_aversion in [0.0, 0.02, 0.2]:
+            whole = formulate_quadratic(held, assets, covariance, risk_aversion, exposure, neighbors)
+            expected = decide(assets, ClassicComputer().maximize(whole))
+            self.assertEqual(list(optimize_quadratic(4, ClassicComputer(), portfolio, assets, covariance, risk_aversion)), expected)
+        self.assertEqual({x.asset.name for x in optimize_quadratic(2, ClassicComputer(), portfolio, assets, covariance, 0.0)},
+                         {x.asset.name for x in optimize_agg(2, ClassicComputer(), portfolio, assets)})
+
+    def test_optimize_agg_parallel(self):
+        market = market1
+        computer = ClassicComputer()
+        sequential = list(optimize_agg(3, computer, market.positions, market.assets_of_interest))
+        parallel = list(optimize_agg(3, computer, market.positions, market.assets_of_interest, workers = 2))
+        self.assertEqual(parallel, sequential)
+        self.assertEqual(sequential, optimize(computer, market.positions, market.assets_of_interest[:3])
+                         + list(optimize_agg(3, computer, market.positions, market.assets_of_interest[3:])))
+
+    def test_optimize_symmetric(self):
+        class CountingComputer(ClassicComputer):
+            solved = 0
+            def maximize(self, formula):
+                self.solved += len(Formula.compile(formula))
+                return super().maximize(formula)
+
+        market = read_portfolio(limit = None, point_to_unit = 3)
+        plain, collapsed = CountingComputer(), CountingComputer()
+        expected = list(optimize_agg(3, plain, market.positions, market.assets_of_interest))
+        actions = list(optimize_agg(3, collapsed, market.positions, market.assets_of_interest, symmetric = True))
+        self.assertEqual(actions, expected)
+        self.assertEqual(plain.solved, len(market.assets_of_interest))
+        self.assertEqual(collapsed.solved, len(group_units(market.positions, market.assets_of_interest)))
+        self.assertLess(collapsed.solved, plain.solved)
+
+        portfolio = [HoldingPosition(appl), HoldingPosition(btc)]
+        self.assertEqual(optimize(ClassicComputer(), portfolio, [appl, btc, math], symmetric = True), [ActingPosition(math)])
+
+    def test_asset_block(self):
+        block = read_portfolio_block(limit = None, point_to_unit = 1)
+        self.assertEqual(len(block), 70)
+        self.assertEqual(list(block.assets()), market1.assets_of_interest)
+        self.assertEqual(list(block.positions()), market1.positions)
+        self.assertEqual(block.asset(69), market1.assets_of_interest[69])
+
+        computer = ClassicComputer()
+        expected = list(optimize_agg(3, computer, market1.positions, market1.assets_of_interest))
+        self.assertEqual(list(optimize_block(3, computer, block)), expected)
+        self.assertEqual(list(optimize_block(3, computer, block, symmetric = True)), expected)
+
+        large = read_portfolio_block(limit = None, point_to_unit = 1000)
+        self.assertEqual(len(large), 1000 * len(block))
+        self.assertEqual(len(large.tickers), len(block.tickers))
+
+    def test_streaming_allocations(self):
+        import csv, random
+        with open('example_portfolio.csv', newline='') as f:
+            rows = list(csv.DictReader(f))
+        lots = [dict(row, allocation = str(float(row['allocation']) * k), allocation_usd = str(float(row['allocation_usd']) * k)) for row in rows for k in [1, 3, 0.5]]
+        random.Random(5).shuffle(lots)
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'lots.csv')
+            with open(path, 'w', newline='') as f:
+                writer = csv.DictWriter(f, fieldnames = list(rows[0]))
+                writer.writeheader()
+                writer.writerows(lots)
+            for t0 in [None, datetime(2021, 5, 1)]:
+                expected = {}
+                for row in lots:
+                    price = get_price(t0, row['ticker'], None) if t0 is not None else None
+                    usd = int(float(row['allocation_usd']))
+                    units = int(usd / (price * 100)) + 1 if price is not None else int(float(row['allocation'])) * 100
+                    total = expected.setdefault(row['ticker'], [0, 0])
+                    total[0], total[1] = total[0] + units, total[1] + usd
+                for chunk_size in [7, 65536]:
+                    allocations = read_allocations(100, t0, path, chunk_size)
+                    self.assertEqual({x.ticker: [x.allocation, x.allocation_usd] for x in allocations}, expected)
+                    self.assertEqual(len(allocations), len(expected))
+
+            # one pass over the csv, t0 and t1 prices are prefetched chunk by chunk along the way
+            from unittest import mock
+            t0, t1 = datetime(2021, 5, 1), datetime(2022, 8, 1)
+            with mock.patch('builtins.open', wraps = open) as opened:
+                read_portfolio(point_to_unit = 100, t0 = t0, t1 = t1, path = path)
+            self.assertEqual(len([x for x in opened.call_args_list if x.args[0] == path]), 1)
+            self.assertEqual(plan_prefetch([row['ticker'] for row in rows], [t0, t1]), {})
+
+    def test_price_store(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            store = PriceStore(os.path.join(tmp, 'prices.db'))
+            self.assertTrue(store.is_empty())
+            store.import_cache({(datetime(2021, 5, 1), "AAPL"): 129, (datetime(2021, 5, 1), "TOT"): None})
+            self.assertEqual(store.lookup(datetime(2021, 5, 1), "AAPL"), (True, 129))
+            self.assertEqual(store.lookup(datetime(2021, 5, 1), "TOT"), (True, None))
+            self.assertEqual(store.lookup(datetime(2021, 5, 2), "AAPL"), (False, None))
+
+            quotes = [(datetime(2021, 6, 1), 124), (datetime(2021, 6, 2), 125), (datetime(2021, 6, 4), 126)]
+            store.append("AAPL", datetime(2021, 5, 30), datetime(2021, 7, 9), quotes)
+            self.assertEqual(store.lookup(datetime(2021, 5, 30), "AAPL"), (True, 124))
+            self.assertEqual(store.lookup(datetime(2021, 6, 3), "AAPL"), (True, 126))
+            self.assertEqual(store.lookup(datetime(2021, 6, 5), "AAPL"), (False, None))
+            self.assertEqual(store.quotes("AAPL", datetime(2021, 6, 2), datetime(2021, 7, 1)), quotes[1:])
+            store.close()
+
+        self.assertEqual(get_price(datetime(2021, 5, 1), "AAPL"), 129)
+        self.assertEqual(get_price(datetime(2021, 5, 1), "TOT", 7), 7)
+
+    def test_prefetch_offline(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            t0, t1 = datetime(2030, 1, 4), datetime(2030, 6, 3)
+            path = os.path.join(tmp, 'quotes.csv')
+            OfflineProvider.write(path, {"AAPL": [(datetime(2030, 1, 6), 201), (datetime(2030, 6, 3), 215)],
+                                         "MSFT": [(datetime(2030, 1, 4), 402)]})
+            provider = OfflineProvider(path)
+            store = PriceStore(os.path.join(tmp, 'prices.db'))
+
+            self.assertEqual(plan_prefetch(["AAPL", "MSFT", "AAPL"], [t0, t1], store), {t0: ["AAPL", "MSFT"], t1: ["AAPL", "MSFT"]})
+            self.assertEqual(prefetch_prices(["AAPL", "MSFT"], [t0, t1], provider, store), 4)
+            self.assertEqual(provider.requests, 2)
+            self.assertEqual(plan_prefetch(["AAPL", "MSFT"], [t0, t1], store), {})
+            self.assertEqual(prefetch_prices(["AAPL", "MSFT"], [t0, t1], provider, store), 0)
+            self.assertEqual(provider.requests, 2)
+
+            self.assertEqual(store.lookup(t0, "AAPL"), (True, 201))
+            self.assertEqual(store.lookup(t1, "AAPL"), (True, 215))
+            self.assertEqual(store.lookup(t0, "MSFT"), (True, 402))
+            self.assertEqual(store.lookup(t1, "MSFT"), (True, None))
+            store.close()
+
+    def test_async(self):
+        import asyncio, threading, time
+
+        class SlowProvider(OfflineProvider):
+            def history(self, tickers, start, end):
+                with lock:
+                    self.running += 1
+                    self.most = max(self.most, self.running)
+                time.sleep(0.02)
+                with lock:
+                    self.running -= 1
+                return super().history(tickers, start, end)
+
+        lock = threading.Lock()
+        market = read_portfolio(limit = 30, point_to_unit = 3)
+        expected = list(optimize_agg(2, ClassicComputer(), market.positions, market.assets_of_interest))
+
+        async def service():
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'quotes.csv')
+                OfflineProvider.write(path, {t: [(datetime(2030, 1, 4), 10 + i)] for i, t in enumerate(["A", "B", "C", "D"])})
+                provider = SlowProvider(path)
+                provider.running, provider.most = 0, 0
+                store = PriceStore(os.path.join(tmp, 'prices.db'))
+                fetched, async_market = await asyncio.gather(
+                    prefetch_prices_async(["A", "B", "C", "D"], [datetime(2030, 1, 4), datetime(2030, 2, 4)], provider, store, concurrency = 2, batch = 1),
+                    read_portfolio_async(limit = 30, point_to_unit = 3))
+                self.assertEqual((fetched, provider.requests, provider.most), (8, 8, 2))
+                self.assertEqual(store.lookup(datetime(2030, 1, 4), "C"), (True, 12))
+                store.close()
+            solved = [x async for x in optimize_agg_async(2, ClassicComputer(), async_market.positions, async_market.assets_of_interest, concurrency = 3)]
+            state = await ClassicComputer().maximize_async(Formula(["a", "b"], np.array([1, -1])))
+            return async_market, solved, state
+
+        async_market, solved, state = asyncio.run(service())
+        self.assertEqual(async_market, market)
+        self.assertEqual(solved, expected)
+        self.assertEqual(state, {"a": 1, "b": 0})
+
+    def test_incremental(self):
+        class CountingComputer(ClassicComputer):
+            solved = 0
+            def maximize(self, formula):
+                self.solved += 1
+                return super().maximize(formula)
+
+        market = read_portfolio(limit = None, point_to_unit = 2)
+        computer = CountingComputer()
+        optimizer = IncrementalOptimizer(3, computer, market.positions, market.assets_of_interest)
+        self.assertEqual(list(optimizer.actions()), list(optimize_agg(3, ClassicComputer(), market.positions, market.assets_of_interest)))
+        before = set(map(action_key, optimizer.actions()))
+
+        computer.solved = 0
+        ticker = ticker_of(market.assets_of_interest[0])
+        units = [x for x in market.assets_of_interest if ticker_of(x) == ticker]
+        delta = optimizer.reprice(ticker, swing_up = 1, swing_down = 30)
+        self.assertEqual(computer.solved, delta.chunks)
+        self.assertLessEqual(delta.chunks, len(units))
+        self.assertTrue(delta.added or delta.removed)
+
+        held = {x.asset.name for x in market.positions}
+        assets = [replace(x, swing_up = 1, swing_down = 30) if ticker_of(x) == ticker else x for x in market.assets_of_interest]
+        positions = [HoldingPosition(x) for x in assets if x.name in held]
+        self.assertEqual(list(optimizer.actions()), list(optimize_agg(3, ClassicComputer(), positions, assets)))
+        after = set(map(action_key, optimizer.actions()))
+        self.assertEqual(set(map(action_key, delta.added)), after - before)
+        self.assertEqual(set(map(action_key, delta.removed)), before - after)
+
+        name = positions[0].asset.name
+        delta = optimizer.update(release = [name])
+        self.assertEqual(delta.chunks, 1)
+        positions = positions[1:]
+        self.assertEqual(list(optimizer.actions()), list(optimize_agg(3, ClassicComputer(), positions, assets)))
+        self.assertEqual(optimizer.update(), ActionDelta([], [], 0))
+
+    def test_knapsack(self):
+        from knapcomp import KnapsackComputer
+        rng = np.random.default_rng(7)
+        for n in range(1, 11):
+            weights, costs = rng.integers(-50, 50, n), rng.integers(-20, 40, n)
+            for budget in [None, 0, 15.5, 60]:
+                formula = Formula([str(i) for i in range(n)], weights, costs = costs, budget = budget)
+                expected = ClassicComputer.calculate(formula, ClassicComputer().maximize(formula))
+                for computer in [KnapsackComputer(), KnapsackComputer(max_cells = 0)]:
+                    state = computer.maximize(formula)
+                    self.assertEqual(ClassicComputer.calculate(formula, state), expected)
+                    if budget is not None:
+                        self.assertLessEqual(np.dot([state[x] for x in formula.names], costs), budget)
+        # both ground truth engines fail the same way when nothing fits
+        for computer in [KnapsackComputer(), ClassicComputer()]:
+            with self.assertRaisesRegex(ValueError, "no state within budget -1"):
+                computer.maximize(Formula(['a', 'b'], np.array([1, 2]), costs = np.array([3, 4]), budget = -1))
+
+        market = read_portfolio(limit = None, point_to_unit = 1000, t0 = datetime(2021, 5, 1), t1 = datetime(2022, 8, 1))
+        portfolio, assets = market.positions[:200], market.assets_of_interest[:2000]
+        self.assertEqual(list(optimize_agg(3, KnapsackComputer(), portfolio, assets)), list(optimize_agg(3, ClassicComputer(), portfolio, assets)))
+        gain = lambda actions: sum(profit(predict(x.asset), 1, True).profit_sum for x in actions)
+        for budget in [500, 5000]:
+            actions = optimize(KnapsackComputer(), [], assets, budget = budget)
+            self.assertLessEqual(sum(x.asset.price_t for x in actions), budget)
+            self.assertLess(len(actions), len(list(optimize_agg(3, KnapsackComputer(), [], assets))))
+            self.assertEqual(gain(optimize_agg(3, KnapsackComputer(max_cells = 0), [], assets, budget = budget)), gain(actions))
+        actions = optimize(KnapsackComputer(), portfolio, assets, budget = -1000)
+        held = {x.asset.name for x in portfolio}
+        self.assertLessEqual(sum(-x.asset.price_t if x.asset.name in held else x.asset.price_t for x in actions), -1000)
+        with self.assertRaises(ValueError):
+            optimize(VectorizedClassicComputer(), portfolio, assets, budget = budget)
+
+    def test_annealing(self):
+        import time
+        from annecomp import AnnealingComputer, HamiltonianComputer
+        rng = np.random.default_rng(3)
+        for n in range(2, 11, 2):
+            pairs = np.array([(i, j) for i in range(n) for j in range(i + 1, n) if rng.random() < 0.4], dtype=np.int64).reshape(-1, 2)
+            formula = Formula([f"x{i}" for i in range(n)], rng.integers(-20, 20, n), pairs, rng.integers(-15, 15, len(pairs)))
+            constrained = Formula(formula.names, formula.weights, pairs, formula.couplings, rng.integers(1, 10, n), 12)
+            for f in [formula, constrained]:
+                state = AnnealingComputer().maximize(f)
+                self.assertEqual(ClassicComputer.calculate(f, state), ClassicComputer.calculate(f, ClassicComputer().maximize(f)))
+            self.assertLessEqual(np.dot([state[x] for x in constrained.names], constrained.costs), 12)
+
+        # an overshoot below one unit of cost is still outside of the budget
+        self.assertEqual(AnnealingComputer().maximize(Formula(['a', 'b'], np.array([100, 1]), costs = np.array([10.0, 1.0]), budget = 9.9)), {'a': 0, 'b': 1})
+        for budget in [0, 15.5]:
+            formula = Formula([f"x{i}" for i in range(8)], rng.integers(-50, 50, 8), costs = rng.integers(-20, 40, 8), budget = budget)
+            state = AnnealingComputer().maximize(formula)
+            self.assertLessEqual(np.dot([state[x] for x in formula.names], formula.costs), budget)
+            self.assertEqual(ClassicComputer.calculate(formula, state), ClassicComputer.calculate(formula, ClassicComputer().maximize(formula)))
+        # chains stuck outside of the budget are repaired, or there is no state within it
+        qp = HamiltonianComputer.formulate_problem(Formula(['a', 'b', 'c'], np.array([5, 4, 1]), costs = np.array([3.0, 2.0, 1.0]), budget = 2.5))
+        self.assertEqual(AnnealingComputer.repair(qp, np.array([1, 1, 1])).tolist(), [0, 1, 0])
+        with self.assertRaises(ValueError):
+            AnnealingComputer().maximize(Formula(['a'], np.array([1]), costs = np.array([1.0]), budget = -1))
+
+        # thousands of banded variables in seconds at the default sweeps
+        n = 2000
+        pairs = np.array([(i, j) for i in range(n) for j in range(i + 1, min(n, i + 4))], dtype=np.int64)
+        formula = Formula([f"x{i}" for i in range(n)], rng.integers(-20, 20, n), pairs, rng.integers(-15, 15, len(pairs)))
+        start = time.perf_counter()
+        state = AnnealingComputer().maximize(formula)
+        self.assertLess(time.perf_counter() - start, 15)
+        self.assertGreater(ClassicComputer.calculate(formula, state), ClassicComputer.calculate(formula, {x: int(w > 0) for x, w in zip(formula.names, formula.weights)}))
+
+    def test_caching_computer(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'solutions.json')
+            computer = CachingComputer(ClassicComputer(), capacity = 2, path = path)
+            first = Formula(["a", "b", "c"], np.array([3, -2, 4]))
+            renamed = Formula(["x", "y", "z"], np.array([-2, 4, 3]))
+            self.assertEqual(computer.maximize(first), {"a": 1, "b": 0, "c": 1})
+            self.assertEqual(computer.maximize(renamed), {"x": 0, "y": 1, "z": 1})
+            self.assertEqual(computer.stats(), {'hits': 1, 'misses': 1, 'size': 1})
+
+            computer.maximize(Formula(["a"], np.array([1])))
+            computer.maximize(Formula(["a"], np.array([-1])))
+            self.assertEqual(computer.stats(), {'hits': 1, 'misses': 3, 'size': 2})
+            computer.maximize(first)
+            self.assertEqual(computer.misses, 4)
+            computer.save()
+
+            restored = CachingComputer(ClassicComputer(), path = path)
+            self.assertEqual(restored.maximize(renamed), {"x": 0, "y": 1, "z": 1})
+            self.assertEqual(restored.stats(), {'hits': 1, 'misses': 0, 'size': 2})
+
+        # batched engines stay batched, misses of a batch go to them as one call
+        class BatchedComputer(ClassicComputer):
+            batched, batch_size, calls = True, 8, []
+            def maximize_many(self, formulas):
+                self.calls.append(len(formulas))
+                return super().maximize_many(formulas)
+
+        batched = CachingComputer(BatchedComputer())
+        self.assertEqual((batched.batched, batched.batch_size), (True, 8))
+        states = batched.maximize_many([first, renamed, Formula(["a"], np.array([1]))])
+        self.assertEqual(states, [{"a": 1, "b": 0, "c": 1}, {"x": 0, "y": 1, "z": 1}, {"a": 1}])
+        self.assertEqual((batched.computer.calls, batched.stats()), ([2], {'hits': 1, 'misses': 2, 'size': 2}))
+        # solutions of one engine configuration are not served to another
+        self.assertNotEqual(CachingComputer(VectorizedClassicComputer(block_bits = 4)).signature(first)[0],
+                            CachingComputer(VectorizedClassicComputer(block_bits = 8)).signature(first)[0])
+
+        market = read_portfolio(limit = None, point_to_unit = 3)
+        computer = CachingComputer(ClassicComputer())
+        expected = list(optimize_agg(3, ClassicComputer(), market.positions, market.assets_of_interest))
+        self.assertEqual(list(optimize_agg(3, computer, market.positions, market.assets_of_interest)), expected)
+        self.assertGreater(computer.hits, 0)
+
+    def test_bench(self):
+        import bench
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'synthetic.csv')
+            bench.synthetic_portfolio(path, 20)
+            self.assertEqual(len(read_tickers(path)), 20)
+            cases = [{"kind": "maximize", "engine": "cla_vec", "vars": 8},
+                     {"kind": "optimize_agg", "engine": "cla", "qbits": 3, "units": 30, "point_to_unit": 10, "path": path}]
+            filters = list(warnings.filters)
+            results = bench.run(cases, isolate = False)
+            self.assertEqual(warnings.filters, filters)
+        self.assertEqual(results[1]["chunk_latency"]["count"], 10)
+        self.assertEqual(bench.regressions(results, results), [])
+        slower = [x | {"wall": x["wall"] * 2 + 1} for x in results]
+        self.assertEqual([key for key, _, _ in bench.regressions(slower, results)], [bench.case_key(x) for x in results])
+
+    def test_backtest_engine(self):
+        t1 = datetime(2021, 5, 1)
+        get_price(t1, "AAPL")
+        units = [Asset("AAPL#" + str(i), 120, 10, 5, "AAPL") for i in range(3)] + [Asset("TOT#" + str(i), 80.5, 12.5, 4, "TOT") for i in range(3)]
+        market = Market(units, [HoldingPosition(units[0]), HoldingPosition(units[1]), HoldingPosition(units[3])])
+        result = backtest.backtest(market, ["AAPL#1", "TOT#3", "TOT#2", "AAPL#2"], t1, 10)
+
+        # same as the backtest used to be computed per unit
+        price_t1 = lambda x: get_price(t1, x.ticker, default = x.price_t - x.price_t * x.swing_down / 100)
+        held = [x.asset for x in market.positions]
+        action = lambda x: "NONE" if not x.name in result.actions else "SELL" if x in held else "BUY"
+        fv = lambda x: {"BUY": get_price(t1, x.ticker, default = x.price_t + x.price_t * x.swing_up / 100) - x.price_t, "SELL": x.price_t}.get(action(x), price_t1(x))
+        no_action = lambda x: price_t1(x) * 10 if x in held else 0
+        expected = [Report(x.name, x in held, x.price_t, price_t1(x), action(x), no_action(x), fv(x) * 10, fv(x) * 10 - no_action(x)) for x in units]
+        self.assertEqual([(str(x.price_t1), x.FV_action, x.delta) for x in result.report], [(str(x.price_t1), x.FV_action, x.delta) for x in expected])
+        self.assertEqual(result.report, expected)
+        self.assertAlmostEqual(result.future_value_with_action, sum(x.FV_action for x in expected))
+        self.assertAlmostEqual(result.future_value_without_action, sum(x.FV_no_action for x in expected))
+
+        block = AssetBlock(["AAPL", "TOT"], np.array([3, 2]), np.array([2, 1]), np.array([200, 400]), np.array([10, 20]), np.array([5, 10]))
+        from_block = backtest.backtest(block, ["AAPL#2", "TOT#0"], t1, 100)
+        from_market = backtest.backtest(Market(list(block.assets()), list(block.positions())), ["AAPL#2", "TOT#0"], t1, 100)
+        self.assertEqual(from_block, from_market)
+        self.assertEqual([x.suggested_action for x in from_block.report], ["NONE", "NONE", "BUY", "SELL", "NONE"])
+
+    def test_engines(self):
+        import engines, subprocess, sys
+        self.assertIsInstance(engine("cla_vec", block_bits = 2), VectorizedClassicComputer)
+        self.assertEqual(set(engines.names()), {"cla", "cla_vec", "ham_c", "ham_q", "grover", "knap", "anneal"})
+        with self.assertRaises(ValueError):
+            engine("abacus")
+        script = "import sys, engines, cli; engines.engine('cla'); print(any(x.startswith('qiskit') for x in sys.modules))"
+        self.assertEqual(subprocess.run([sys.executable, "-c", script], capture_output = True, text = True, check = True).stdout.strip(), "False")
+
+        import cli
+        args = cli.parser().parse_args(["optimize", "--computer", "cla", "--set", "limit=4", "--set", "qbits=2"])
+        self.assertEqual((args.run, cli.config(args).computer, cli.config(args).limit, cli.config(args).qbits), (cli.optimize, "cla", 4, 2))
+
+    def test_sweep(self):
+        import sweep, bench, testutil
+        windows = sweep.rolling(datetime(2030, 1, 1), datetime(2030, 7, 1), timedelta(days = 60), timedelta(days = 90))
+        self.assertEqual([backtest.dates(BacktestConfig(**w)) for w in windows],
+                         [(datetime(2030, 1, 1), datetime(2030, 4, 1)), (datetime(2030, 3, 2), datetime(2030, 5, 31))])
+        configs = sweep.grid(BacktestConfig(computer = "cla", limit = 12, point_to_unit = 10), windows, computer = ["cla", "cla_vec"], qbits = [2, 3])
+        self.assertEqual(len(configs), 8)
+        self.assertEqual(len({sweep.market_key(x) for x in configs}), 2)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'synthetic.csv')
+            bench.synthetic_portfolio(path, 6)
+            quotes = os.path.join(tmp, 'quotes.csv')
+            OfflineProvider.write(quotes, {t: [(d, 100 + 7 * i + 13 * j) for j, d in enumerate(sorted({d for x in configs for d in backtest.dates(x)}))]
+                                           for i, t in enumerate(read_tickers(path))})
+            provider = OfflineProvider(quotes)
+            saved = testutil.price_store, testutil.price_store_path, testutil.price_provider
+            testutil.price_store, testutil.price_store_path = None, os.path.join(tmp, 'prices.db')
+            set_price_provider(provider)
+            try:
+                filters = list(warnings.filters)
+                rows = sweep.sweep(configs, path = path)
+                self.assertEqual(warnings.filters, filters)
+                self.assertEqual(provider.requests, 4)
+                parallel = sweep.sweep(configs[:2], workers = 2, path = path)
+                self.assertEqual(provider.requests, 4)
+                testutil.price_store.close()
+            finally:
+                testutil.price_store, testutil.price_store_path, testutil.price_provider = saved
+
+        drop = lambda x: {k: v for k, v in x.items() if k != 'seconds'}
+        self.assertEqual([drop(x) for x in parallel], [drop(x) for x in rows[:2]])
+        for cla, cla_vec in zip(rows[0::4] + rows[1::4], rows[2::4] + rows[3::4]):
+            self.assertEqual(drop(cla) | {'computer': 'cla_vec'}, drop(cla_vec))
+        self.assertGreater(rows[0]['actions'], 0)
+        self.assertEqual(len(sweep.table(rows).splitlines()), 9)
+
+    def test_scheduler(self):
+        from hamicomp import HamiltonianComputerQuantum
+        from scheduler import CostModel, Scheduler, balanced_bounds, fit, priors
+        from engines import names as engine_names
+        self.assertEqual(balanced_bounds(10, 4), [(0, 3), (3, 6), (6, 10)])
+        self.assertEqual(balanced_bounds(3, 4, 7), [(7, 10)])
+        self.assertEqual(CostModel(1, 0.001).best_width(), 8)
+        self.assertEqual(priors["ham_q"].best_width(), 4)
+        self.assertEqual(priors["ham_q"].best_width(memory_budget = 16 * 2 ** 3), 3)
+        self.assertEqual(priors["cla"].best_width(memory_budget = 1000 * 2 ** 2), 2)
+        self.assertEqual(set(priors), set(engine_names()))
+        self.assertEqual(Scheduler({"knap": None}).plan(10), [("knap", 0, 10)])
+        with self.assertRaisesRegex(ValueError, "no cost model"):
+            Scheduler({"mine": None}).plan(10)
+        model = fit([2, 4, 6, 8, 10], [0.5 + 0.01 * 2 ** w for w in [2, 4, 6, 8, 10]], CostModel(0, 0))
+        self.assertAlmostEqual(model.seconds(12), 0.5 + 0.01 * 2 ** 12, delta = 0.5)
+
+        market = read_portfolio(limit = 40, point_to_unit = 3)
+        expected = list(optimize_agg(3, ClassicComputer(), market.positions, market.assets_of_interest))
+        engines = {"cla_vec": VectorizedClassicComputer(), "cla": ClassicComputer()}
+        models = {"cla_vec": CostModel(0.1, 0, max_width = 4), "cla": CostModel(0.001, 0, max_width = 4)}
+        scheduler = Scheduler(engines, models, time_budget = 0.5)
+        plan = scheduler.plan(40)
+        self.assertEqual([(x, y) for _, x, y in plan], balanced_bounds(40, 4))
+        self.assertEqual([start for name, start, _ in plan if name == "cla_vec"], [0, 12, 24, 36])
+        self.assertEqual(list(scheduler.optimize(market.positions, market.assets_of_interest)), expected)
+        self.assertEqual({x for x, _, _ in Scheduler(engines, models).plan(40)}, {"cla_vec"})
+
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", category=DeprecationWarning)
+            self.assertEqual(HamiltonianComputerQuantum().maximize(Formula(["a"], np.array([5]))), {"a": 1})
+
+    def test_instrument(self):
+        import instrument
+        instrument.reset()
+        instrument.enable()
+        try:
+            market = read_portfolio(limit = 12, point_to_unit = 3)
+            list(optimize_agg(3, ClassicComputer(), market.positions, market.assets_of_interest))
+            optimize(ClassicComputer(), market.positions[:2], market.assets_of_interest[:3])
+            get_price(datetime(2021, 5, 1), "AAPL")
+            get_price(datetime(2021, 5, 1), "AAPL")
+            with tempfile.TemporaryDirectory() as tmp:
+                path = os.path.join(tmp, 'trace.json')
+                with contextlib.redirect_stderr(io.StringIO()) as printed:
+                    instrument.report(path)
+                trace = load(path[:-len('.json')])
+        finally:
+            instrument.enable(False)
+        self.assertIn('maximize', printed.getvalue())
+        names = {x['name'] for x in trace['traceEvents']}
+        self.assertTrue({'read_portfolio', 'read_allocations', 'get_assets', 'formulate', 'maximize'} <= names)
+        self.assertEqual(len([x for x in trace['traceEvents'] if x['name'] == 'formulate']), 5)
+        self.assertEqual(instrument.counters['price.hits'] + instrument.counters['price.store_hits'], 2)
+        self.assertGreater(instrument.counters['portfolio.units'], 12)
+        self.assertIn('maximize', instrument.summary())
+        instrument.reset()
+        with instrument.span('off'):
+            instrument.count('off')
+        self.assertEqual((instrument.events, dict(instrument.counters)), ([], {}))
+        with tempfile.TemporaryDirectory() as tmp:
+            instrument.report(os.path.join(tmp, 'trace.json'))
+            self.assertEqual(os.listdir(tmp), [])
+
+    def test_grover(self):
+        from grocomp import GroverComputer
+        from qiskit.quantum_info import Statevector
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", category=DeprecationWarning, module=r'.*qiskit.*')
+            warnings.filterwarnings("ignore", category=PendingDeprecationWarning, module=r'.*qiskit.*')
+            weights, flipped = GroverComputer(precision = 2).quantize(Formula(["a", "b", "c"], np.array([30, -10, 20])))
+            self.assertEqual((weights, flipped), ([3, 1, 2], [False, True, False]))
+            oracle = GroverComputer.build_oracle(weights, flipped, 4)
+            state = Statevector.from_label("0" * (oracle.num_qubits - 3) + "+++").evolve(oracle)
+            for x in range(8):
+                bits = [(x >> i) & 1 for i in range(3)]
+                score = 3 * bits[0] + (1 - bits[1]) + 2 * bits[2]
+                self.assertAlmostEqual(state.data[x].real * 8 ** 0.5, -1 if score >= 4 else 1)
+
+            computer = GroverComputer()
+            rng = np.random.default_rng(5)
+            formulas = [Formula(["x" + str(i) for i in range(n)], rng.integers(-50, 50, n)) for n in [1, 3, 4]]
+            states = computer.maximize_many(formulas)
+            self.assertEqual(states, [ClassicComputer().maximize(f) for f in formulas])
+            self.assertEqual(computer.maximize(formulas[2]), states[2])
+            self.assertEqual(pickle.loads(pickle.dumps(computer)).maximize(formulas[1]), states[1])
+
+            # optimal on many random formulas, not only on one seed
+            for seed in range(10):
+                rng = np.random.default_rng(seed)
+                formulas = [Formula(["x" + str(i) for i in range(n)], rng.integers(-50, 50, n)) for n in range(1, 6)]
+                states = GroverComputer(seed = seed).maximize_many(formulas)
+                for formula, state in zip(formulas, states):
+                    self.assertEqual(ClassicComputer.calculate(formula, state), ClassicComputer.calculate(formula, ClassicComputer().maximize(formula)))
+
+    def test_simulator_plan(self):
+        from aerplan import SimulatorPlan, choose
+        from hamicomp import HamiltonianComputerQuantum
+        from memory import available_memory
+        # page cache the kernel can reclaim counts as available, not only free pages
+        if os.path.exists('/proc/meminfo'):
+            self.assertGreaterEqual(available_memory(), os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE'))
+        self.assertEqual(choose(3), SimulatorPlan())
+        self.assertEqual(choose(30, 2 ** 35, shots = 64), SimulatorPlan(shots = 64))
+        self.assertEqual(choose(32, 2 ** 35, shots = 64), SimulatorPlan(precision = "single", shots = 64))
+        self.assertEqual(choose(70, 2 ** 35).method, "matrix_product_state")
+        self.assertEqual(SimulatorPlan().backend_options(), {})
+        with self.assertRaises(MemoryError):
+            choose(70, 2 ** 18)
+
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", category=DeprecationWarning, module=r'.*qiskit.*')
+            warnings.filterwarnings("ignore", category=PendingDeprecationWarning, module=r'.*qiskit.*')
+            with self.assertRaises(MemoryError):
+                HamiltonianComputerQuantum(memory_budget = 2 ** 18).maximize(Formula([f"x{i}" for i in range(70)], np.arange(70) - 35))
+            computer = HamiltonianComputerQuantum(maxiter = 30, memory_budget = 2 ** 18, shots = 256)
+            formula = Formula([f"x{i}" for i in range(16)], np.arange(16) - 8)
+            state = computer.maximize(formula)
+            self.assertEqual(computer.plan(16).method, "matrix_product_state")
+            self.assertEqual(set(state), set(formula.names))
+            computer = HamiltonianComputerQuantum(memory_budget = 2 ** 16)
+            state = computer.maximize(Formula(["a", "b", "c"], np.array([5, -3, 2])))
+            self.assertEqual(state, {"a": 1, "b": 0, "c": 1})
+
     def test_hamiltonian_classic(self):
+        from hamicomp import HamiltonianComputerClassicEigen
         computer = HamiltonianComputerClassicEigen()
         portfolio = [HoldingPosition(appl), HoldingPosition(btc)]
         candidates = [appl, btc, math]
@@ -35,6 +650,7 @@ class Testing(unittest.TestCase):
         self.assertEqual(decisions, expected_decisions)
 
     def test_hamiltonian_quantum(self):
+        from hamicomp import HamiltonianComputerQuantum
         with warnings.catch_warnings():
             warnings.filterwarnings("ignore", category=DeprecationWarning, module=r'.*qiskit.*')
             warnings.filterwarnings("ignore", category=PendingDeprecationWarning, module=r'.*qiskit.*') 
@@ -47,6 +663,40 @@ class Testing(unittest.TestCase):
             expected_decisions = [ActingPosition(math)]
             self.assertEqual(decisions, expected_decisions)
 
+    def test_hamiltonian_quantum_reuse(self):
+        from hamicomp import HamiltonianComputerQuantum
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", category=DeprecationWarning, module=r'.*qiskit.*')
+            warnings.filterwarnings("ignore", category=PendingDeprecationWarning, module=r'.*qiskit.*')
+
+            computer = HamiltonianComputerQuantum()
+            actions = list(optimize_agg(2, computer, [HoldingPosition(appl)], [appl, btc, math, Asset("ETH", 300)]))
+            self.assertEqual(actions, [ActingPosition(btc), ActingPosition(math), ActingPosition(Asset("ETH", 300))])
+            self.assertEqual(list(computer.ansatze), [2])
+            self.assertEqual(list(computer.optimal_points), [2])
+
+            copy = pickle.loads(pickle.dumps(computer))
+            self.assertEqual(copy.ansatze, {})
+            self.assertTrue(copy.warm_start)
+
+    def test_hamiltonian_quantum_batch(self):
+        from hamicomp import HamiltonianComputerQuantum
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", category=DeprecationWarning, module=r'.*qiskit.*')
+            warnings.filterwarnings("ignore", category=PendingDeprecationWarning, module=r'.*qiskit.*')
+
+            computer = HamiltonianComputerQuantum(warm_start = False)
+            formulas = [Formula(["a", "b"], np.array([5, -3])), Formula(["c", "d", "e"], np.array([-4, 2, 6])), Formula(["f", "g"], np.array([-1, 2]))]
+            states = computer.maximize_many(formulas)
+            self.assertEqual(states, [{"a": 1, "b": 0}, {"c": 0, "d": 1, "e": 1}, {"f": 0, "g": 1}])
+            self.assertEqual(computer.batch_sampler.parties, 0)
+            self.assertEqual(computer.batch_sampler.pending, [])
+
+            market = market2
+            self.assertTrue(computer.batched)
+            actions = list(optimize_agg(2, computer, market.positions, market.assets_of_interest))
+            self.assertEqual([x.asset.name for x in actions], load('decisions_chunk_q'))
+
     def test_full_portfolio(self):
         market = market1
         self.assertEqual(len(market.assets_of_interest), 70)
@@ -58,9 +708,11 @@ class Testing(unittest.TestCase):
 
             # optimize(HamiltonianComputerQuantum(), market.positions, market.assets_of_interest)
             # Insufficient memory to run circuit nlocal using the statevector simulator. Required memory: 18014398509481984M, max memory: 16384M'
+            # the width is now planned before submitting: 70 qubits run as a matrix product state (or fail fast)
 
     
     def test_portfolio_chunk_ham_classic(self):
+        from hamicomp import HamiltonianComputerClassicEigen
         market = market2
         self.assertEqual(len(market.assets_of_interest), 4)
         self.assertEqual(len(market.positions), 2)
@@ -75,6 +727,7 @@ class Testing(unittest.TestCase):
         
 
     def test_portfolio_chunk_ham_q(self):
+        from hamicomp import HamiltonianComputerQuantum
         market = market2
         self.assertEqual(len(market.assets_of_interest), 4)
         self.assertEqual(len(market.positions), 2)
@@ -97,86 +750,16 @@ class Testing(unittest.TestCase):
         cfg_raw = load('backtest_config')
         cfg: BacktestConfig = make_dataclass( "BacktestConfig", ((k, type(v)) for k, v in cfg_raw.items()))(**cfg_raw)
 
-        t0 = datetime(cfg.t0y, cfg.t0m, cfg.t0d)
-        t1 = datetime(cfg.t1y, cfg.t1m, cfg.t1d)
- 
-        point_to_unit = cfg.point_to_unit
-        real_market = read_portfolio(limit = cfg.limit, point_to_unit = point_to_unit, t0 = t0, t1 = t1, risk = RiskModel(cfg.risk_lev, cfg.risk_spre))
-        market = real_market
-
-        #self.assertEqual(len(market.assets_of_interest), 4)
-        #self.assertEqual(len(market.positions), 2)
-
-
         with warnings.catch_warnings():
             warnings.filterwarnings("ignore", category=DeprecationWarning, module=r'.*qiskit.*')
             warnings.filterwarnings("ignore", category=PendingDeprecationWarning, module=r'.*qiskit.*') 
             warnings.filterwarnings("ignore", category=DeprecationWarning, module=r'.*portfolio.*')
 
-            def get_computer(name: str):
-                match name:
-                    case "cla":
-                        return ClassicComputer()
-                    case "ham_q":
-                        return HamiltonianComputerQuantum()
-                    case "ham_c":
-                        return HamiltonianComputerClassicEigen()
-
-            actions = optimize_agg(cfg.qbits, get_computer(cfg.computer), market.positions, market.assets_of_interest)
-            # simulator bug?? ham_q, limit = 10, qbits = 3, qiskit.exceptions.QiskitError: 'block_size (2) cannot be larger than number of qubits (1)'
-            result = [x.asset.name for x in actions]
-            dump('actions_backtesting', result)
-        
-        in_portfolio = [x.asset for x in market.positions]
-        to_sell = [x.asset for x in market.positions if x.asset.name in result]
-        to_buy = [x for x in market.assets_of_interest if x.name in result and not x in in_portfolio]
-        to_hold = [x for x in market.assets_of_interest if not x.name in result] 
-
-        #print(to_sell)
-        #print(to_buy)
-        #print(to_hold)
-
-        # we take projection in absense of data
-        project_price_up: Callable[[Asset], int] = lambda x: x.price_t + x.price_t * x.swing_up / 100
-        project_price_down: Callable[[Asset], int]  = lambda x: x.price_t - x.price_t * x.swing_down / 100
-
-        # buy t0, sell t1 (liquidity note: immediate zero-interest loan assumed)
-        profit_from_buying_at_t0: Callable[[Asset], int]  = lambda x: get_price(t1, x.ticker, default = project_price_up(x)) - x.price_t
+            result = backtest.run(cfg, engine(cfg.computer))
+            dump('actions_backtesting', result.actions)
 
-        # sell t0
-        cash_from_selling_at_t0: Callable[[Asset], int]  = lambda x: x.price_t
-
-        # hold t0, sell t1
-        cash_from_selling_at_t1: Callable[[Asset], int]  = lambda x: get_price(t1, x.ticker, default = project_price_down(x))
-        
-        # backtested portfolio value without taking any action
-        
-        no_action_fvs = map(lambda x:  cash_from_selling_at_t1(x.asset), market.positions)
-        future_value_without_action = sum(no_action_fvs) * point_to_unit
-
-        # backtested value from taking action  
-        
-        action_fv: Callable[[Asset], int] = lambda x:  profit_from_buying_at_t0(x) \
-                         if x in to_buy else (cash_from_selling_at_t0(x) \
-                                              if x in to_sell else cash_from_selling_at_t1(x))
-        action_fvs = map(action_fv, market.assets_of_interest)
-        
-        future_value_with_action = sum(action_fvs) * point_to_unit
-        #print(future_value_with_action)
-        #print(future_value_without_action)
-
-        report = [Report(x.name,
-                x in in_portfolio,
-                x.price_t, 
-                get_price(t1, x.ticker, default = project_price_down(x)), 
-                "BUY" if x in to_buy else "SELL" if x in to_sell else "NONE", 
-                cash_from_selling_at_t1(x) * point_to_unit if x in in_portfolio else 0,  
-                action_fv(x) * point_to_unit,
-                action_fv(x) * point_to_unit - (cash_from_selling_at_t1(x) * point_to_unit if x in in_portfolio else 0)) 
-                    for x in market.assets_of_interest]
-
-        dump_csv_report(report)
-        self.assertGreater(future_value_with_action, future_value_without_action)
+        dump_csv_report(result.report)
+        self.assertGreater(result.future_value_with_action, result.future_value_without_action)
         
 if __name__ == '__main__':
         unittest.main()
\ No newline at end of file
@@ -1,13 +1,16 @@
-from portfolio import Asset, HoldingPosition
+from portfolio import Asset, HoldingPosition, AssetBlock
+from pricestore import PriceStore, day
+from instrument import span, count
+from pricefeed import PriceProvider, YahooProvider, OfflineProvider
 from dataclasses import dataclass
-from operator import add
-from functools import reduce
 import csv
 import itertools
-import yfinance as yf
 from datetime import datetime, timedelta
-from typing import Optional, TypeVar, Callable
+from typing import Optional, TypeVar, Callable, Iterable, Iterator
+import asyncio
 import json
+import os
+import numpy as np
 
 
 
@@ -43,7 +46,7 @@ class Report:
     delta: int
 
 def dump_csv_report(data: list[Report]): 
-    with open('report.csv', 'w') as f:
+    with span('report', rows=len(data)), open('report.csv', 'w') as f:
         header = ['Asset', 'Portfolio', 'Price t0', 'Price t1', "Action", "FV No Action", "FV Action", "Delta"]
         row_format = '{:<15}  {:<10}  {:<10}  {:<10}  {:<7}  {:<12}  {:<12}  {:<12}'
         print(row_format.format(*header), file=f)
@@ -81,6 +84,7 @@ class Allocation:
     ticker: str
     allocation: int # assume a unit = (1/point_to_unit)%
     allocation_usd: int
+    sector: Optional[str] = None
 
 @dataclass
 class Market:
@@ -93,49 +97,155 @@ class RiskModel:
     spread: float = 0.0
 
 
-def sum_allocations_by_ticker(allocations: list[Allocation]) -> list[Allocation]:
-    tickers = set(map(lambda x: x.ticker, allocations))
-    grouped = [[y for y in allocations if y.ticker == x] for x in tickers]
-    return [Allocation(g[0].ticker, reduce(add, map(lambda x: x.allocation, g)), reduce(add, map(lambda x: x.allocation_usd, g))) for g in grouped]
+# one pass, totals are kept per ticker (in order of first appearance), so allocations can be a stream of lots
+def sum_allocations_by_ticker(allocations: Iterable[Allocation]) -> list[Allocation]:
+    totals: dict[str, Allocation] = {}
+    for x in allocations:
+        total = totals.get(x.ticker)
+        if total is None:
+            totals[x.ticker] = Allocation(x.ticker, x.allocation, x.allocation_usd, x.sector)
+        else:
+            total.allocation += x.allocation
+            total.allocation_usd += x.allocation_usd
+    return list(totals.values())
 
 
+# prices seen by this process, in front of the store
 price_cache: dict[(datetime, str), int] = {}
 
+price_store: Optional[PriceStore] = None
+price_store_path = 'price_cache.db'
+price_horizon = timedelta(days=40)
+
+# where missing prices come from, e.g. OfflineProvider('quotes.csv') for runs without network
+price_provider: PriceProvider = YahooProvider()
+
+def set_price_provider(provider: PriceProvider):
+    global price_provider
+    price_provider = provider
+
+# opens the store on first use, seeding it once from the old price_cache.json
+def get_price_store() -> PriceStore:
+    global price_store
+    if price_store is None:
+        price_store = PriceStore(price_store_path, price_horizon)
+        if price_store.is_empty() and os.path.exists('price_cache.json'):
+            price_store.import_cache(decode(load('price_cache')))
+    return price_store
+
 def get_price(date: datetime, ticker: str, default = None) -> int:
     if (date, ticker) in price_cache:
-        result = price_cache[(date, ticker)]
-        if result is None:
-            return default
-        else:
-            return price_cache[(date, ticker)]
-    
-    yticker = yf.Ticker(ticker)
-    final_time = date + timedelta(days=40)
-    prices = list(yticker.history(start=date, end=final_time, interval='1d')['Close'].iloc)
-    print(ticker)
-    if len(list(prices)) == 0:
-        price_cache[(date, ticker)] = default
-        return default
+        count('price.hits')
     else:
-        print(prices[0])
-        price_cache[(date, ticker)] = int(prices[0])
-        return int(prices[0])
-
-def read_allocations(point_to_unit, t0) -> list[Allocation]:
-    with open('example_portfolio.csv', newline='') as csvfile:
+        store = get_price_store()
+        found, price = store.lookup(date, ticker)
+        if found:
+            count('price.store_hits')
+        else:
+            count('price.misses')
+            final_time = date + price_horizon
+            with span('price.fetch', ticker=ticker):
+                quotes = price_provider.history([ticker], date, final_time).get(ticker, [])
+            store.append(ticker, date, final_time, quotes)
+            price = quotes[0][1] if len(quotes) > 0 else None
+        price_cache[(date, ticker)] = price
+
+    result = price_cache[(date, ticker)]
+    return default if result is None else result
+
+# (ticker, date) pairs the store can't answer yet, grouped by date
+def plan_prefetch(tickers: Iterable[str], dates: Iterable[datetime], store: Optional[PriceStore] = None) -> dict[datetime, list[str]]:
+    store = store or get_price_store()
+    tickers = list(dict.fromkeys(tickers))
+    plan = {d: [t for t in tickers if (d, t) not in price_cache and not store.lookup(d, t)[0]] for d in dict.fromkeys(dates) if d is not None}
+    return {d: missing for d, missing in plan.items() if len(missing) > 0}
+
+# fills the store with one multi-ticker request per date, so get_price doesn't go to the provider ticker by ticker
+def prefetch_prices(tickers: Iterable[str], dates: Iterable[datetime], provider: Optional[PriceProvider] = None, store: Optional[PriceStore] = None) -> int:
+    dates = [d for d in dates if d is not None]
+    if len(dates) == 0:
+        return 0
+    provider = provider or price_provider
+    store = store or get_price_store()
+    plan = plan_prefetch(list(tickers), dates, store)
+    for date, missing in plan.items():
+        count('price.prefetched', len(missing))
+        with span('price.prefetch', date=day(date), tickers=len(missing)):
+            history = provider.history(missing, date, date + price_horizon)
+        for ticker in missing:
+            store.append(ticker, date, date + price_horizon, history.get(ticker, []))
+    return sum(map(len, plan.values()))
+
+# prefetch_prices for an event loop: requests of at most `batch` tickers run in threads, `concurrency` at a time
+async def prefetch_prices_async(tickers: Iterable[str], dates: Iterable[datetime], provider: Optional[PriceProvider] = None, store: Optional[PriceStore] = None,
+                                concurrency: int = 4, batch: int = 50) -> int:
+    dates = [d for d in dates if d is not None]
+    if len(dates) == 0:
+        return 0
+    provider = provider or price_provider
+    store = store or await asyncio.to_thread(get_price_store)
+    plan = await asyncio.to_thread(plan_prefetch, list(tickers), dates, store)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    def fetch(date: datetime, missing: list[str]):
+        with span('price.prefetch', date=day(date), tickers=len(missing)):
+            history = provider.history(missing, date, date + price_horizon)
+        for ticker in missing:
+            store.append(ticker, date, date + price_horizon, history.get(ticker, []))
+
+    async def bounded(date: datetime, missing: list[str]):
+        async with semaphore:
+            count('price.prefetched', len(missing))
+            await asyncio.to_thread(fetch, date, missing)
+
+    await asyncio.gather(*(bounded(date, missing[i:i + batch]) for date, missing in plan.items() for i in range(0, len(missing), batch)))
+    return sum(map(len, plan.values()))
+
+async def get_price_async(date: datetime, ticker: str, default = None) -> int:
+    return await asyncio.to_thread(get_price, date, ticker, default)
+
+def read_tickers(path: str = 'example_portfolio.csv') -> list[str]:
+    with open(path, newline='') as csvfile:
+        return list(dict.fromkeys(row['ticker'] for row in csv.DictReader(csvfile)))
+
+# sector column of the portfolio (first one wins for repeated tickers)
+def read_sectors(path: str = 'example_portfolio.csv') -> dict[str, str]:
+    with open(path, newline='') as csvfile:
+        sectors = {}
+        for row in csv.DictReader(csvfile):
+            sectors.setdefault(row['ticker'], row['sector'])
+        return sectors
+
+# rows of a csv, `size` at a time
+def read_chunks(path: str, size: int = 65536) -> Iterator[list[dict[str, str]]]:
+    with open(path, newline='') as csvfile:
         reader = csv.DictReader(csvfile)
-        def units(ticker, allocation, allocation_usd):
-            if t0 == None:
-                return allocation * point_to_unit
-            else:
-                price = get_price(t0, ticker, None)
-                if price != None:
-                    return int(allocation_usd / (price * point_to_unit)) + 1
-                else:
-                    return allocation * point_to_unit
-            
-        allocations = [Allocation(row['ticker'], units(row['ticker'], int(float(row['allocation'])), int(float(row['allocation_usd']))), int(float(row['allocation_usd']))) for row in reader]
-        return sum_allocations_by_ticker(allocations)
+        while rows := list(itertools.islice(reader, size)):
+            yield rows
+
+# streams the csv in chunks of rows and sums lots per ticker as they come, memory follows distinct tickers, not rows
+# t0 (and t1, for the assets read later) prices of the tickers first seen in a chunk are prefetched together, t0 ones are
+# looked up once per ticker; this is the only pass over the csv
+def read_allocations(point_to_unit, t0, path: str = 'example_portfolio.csv', chunk_size: int = 65536, t1: Optional[datetime] = None) -> list[Allocation]:
+    prices: dict[str, Optional[int]] = {}
+    def units(ticker, allocation, allocation_usd):
+        price = prices.get(ticker)
+        if price != None:
+            return int(allocation_usd / (price * point_to_unit)) + 1
+        else:
+            return allocation * point_to_unit
+
+    def allocations() -> Iterator[Allocation]:
+        for rows in read_chunks(path, chunk_size):
+            if t0 != None:
+                new = [x for x in dict.fromkeys(row['ticker'] for row in rows) if x not in prices]
+                prefetch_prices(new, [t0, t1])
+                prices.update((x, get_price(t0, x, None)) for x in new)
+            for row in rows:
+                allocation_usd = int(float(row['allocation_usd']))
+                yield Allocation(row['ticker'], units(row['ticker'], int(float(row['allocation'])), allocation_usd), allocation_usd, row.get('sector'))
+
+    return sum_allocations_by_ticker(allocations())
 
 
 
@@ -180,6 +290,18 @@ def get_assets(allocations: list[Allocation], t0: datetime, t1: datetime, risk:
     fragmented = map(lambda a: split(a), allocations)
     return list(itertools.chain.from_iterable(fragmented))
 
+# columnar version of get_assets + get_positions: units stay in ticker order (numeric within a ticker), nothing is split per unit
+def get_asset_block(allocations: list[Allocation], t0: datetime, t1: datetime, risk: RiskModel, limit: Optional[int] = None, open_positions_ratio = 0.6) -> AssetBlock:
+    units = np.array([a.allocation for a in allocations], dtype=np.int64)
+    if limit is not None:
+        units = np.clip(limit - np.concatenate(([0], np.cumsum(units)[:-1])), 0, units)
+    k = int(open_positions_ratio * int(units.sum()))
+    held = np.clip(k - np.concatenate(([0], np.cumsum(units)[:-1])), 0, units)
+    return AssetBlock([a.ticker for a in allocations], units, held,
+                      np.array([get_asset_price(a, t0, 100) for a in allocations]),
+                      np.array([approximate_price_up(a.ticker, t0, t1, risk) for a in allocations]),
+                      np.array([approximate_price_down(a.ticker, t0, t1, risk) for a in allocations]))
+
 def get_positions(assets: list[Asset], open_positions_ratio) -> list[HoldingPosition]:
     n = len(assets)
     k = int(open_positions_ratio * n)
@@ -187,17 +309,33 @@ def get_positions(assets: list[Asset], open_positions_ratio) -> list[HoldingPosi
 
 
 # point_to_unit either converts allocation persent point to unit or a share to unit
-def read_portfolio(limit: Optional[int] = None, point_to_unit = 10, t0: datetime = None, t1: datetime = None, open_positions_ratio = 0.6, risk: RiskModel = RiskModel()) -> Market:
-    global price_cache
-    price_cache = decode(load('price_cache'))
-    allocations = read_allocations(point_to_unit, t0)
-    allocations.sort(key = lambda x: x.ticker)
-    assets_of_interest = get_assets(allocations, t0, t1, risk)
-    if len(assets_of_interest) > 300000:
-        print("fragmentation: " + str(len(assets_of_interest)))
-    assets_of_interest.sort(key = lambda x: x.name)
-    assets_of_interest = assets_of_interest[:limit]
-    portfolio = get_positions(assets_of_interest, open_positions_ratio)
-    portfolio.sort(key = lambda x: x.asset.name)
-    dump('price_cache', encode(price_cache))
-    return Market(assets_of_interest, portfolio)
+def read_portfolio(limit: Optional[int] = None, point_to_unit = 10, t0: datetime = None, t1: datetime = None, open_positions_ratio = 0.6, risk: RiskModel = RiskModel(), path: str = 'example_portfolio.csv') -> Market:
+    with span('read_portfolio', point_to_unit=point_to_unit):
+        with span('read_allocations'):
+            allocations = read_allocations(point_to_unit, t0, path, t1 = t1)
+        allocations.sort(key = lambda x: x.ticker)
+        with span('get_assets'):
+            assets_of_interest = get_assets(allocations, t0, t1, risk)
+        count('portfolio.units', len(assets_of_interest))
+        assets_of_interest.sort(key = lambda x: x.name)
+        assets_of_interest = assets_of_interest[:limit]
+        portfolio = get_positions(assets_of_interest, open_positions_ratio)
+        portfolio.sort(key = lambda x: x.asset.name)
+        return Market(assets_of_interest, portfolio)
+
+# prices are prefetched concurrently first, the rest of read_portfolio runs in a thread
+async def read_portfolio_async(limit: Optional[int] = None, point_to_unit = 10, t0: datetime = None, t1: datetime = None, open_positions_ratio = 0.6, risk: RiskModel = RiskModel(),
+                               path: str = 'example_portfolio.csv', concurrency: int = 4) -> Market:
+    await prefetch_prices_async(await asyncio.to_thread(read_tickers, path), [t0, t1], concurrency=concurrency)
+    return await asyncio.to_thread(read_portfolio, limit, point_to_unit, t0, t1, open_positions_ratio, risk, path)
+
+# same as read_portfolio, but returns the columnar form (memory doesn't grow with point_to_unit)
+def read_portfolio_block(limit: Optional[int] = None, point_to_unit = 10, t0: datetime = None, t1: datetime = None, open_positions_ratio = 0.6, risk: RiskModel = RiskModel(), path: str = 'example_portfolio.csv') -> AssetBlock:
+    with span('read_portfolio_block', point_to_unit=point_to_unit):
+        with span('read_allocations'):
+            allocations = read_allocations(point_to_unit, t0, path, t1 = t1)
+        allocations.sort(key = lambda x: x.ticker)
+        with span('get_asset_block'):
+            block = get_asset_block(allocations, t0, t1, risk, limit, open_positions_ratio)
+        count('portfolio.units', len(block))
+        return block